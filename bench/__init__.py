@@ -0,0 +1 @@
+"""Offline benchmarker for bilde- og PDF-rutinene i ``core``."""
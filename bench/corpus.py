@@ -0,0 +1,142 @@
+"""Genererer et deterministisk testkorpus for benchmarkene.
+
+Korpuset består av gjennomsiktige PNG-er, store JPEG-er, HEIC-filer (hvis
+``pillow_heif`` er installert), en logo og PDF-er med flere hundre sider.
+Samme frø gir alltid samme filer, og korpuset gjenbrukes så lenge
+spesifikasjonen i ``manifest.json`` er uendret.
+"""
+import json
+import random
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+from core.lazy import is_available, register_heif
+
+SEED = 20240611
+
+FULL_SPEC = {
+    "seed": SEED,
+    "transparent_png": {"count": 24, "size": (2000, 1600)},
+    "large_jpeg": {"count": 12, "size": (6000, 4000)},
+    "heic": {"count": 6, "size": (4032, 3024)},
+    "pdf": {"count": 2, "pages": 300},
+}
+
+QUICK_SPEC = {
+    "seed": SEED,
+    "transparent_png": {"count": 6, "size": (800, 600)},
+    "large_jpeg": {"count": 4, "size": (2000, 1500)},
+    "heic": {"count": 2, "size": (1200, 900)},
+    "pdf": {"count": 1, "pages": 40},
+}
+
+
+def _shapes(draw, rng, box, count, alpha):
+    """Tegner tilfeldige ellipser og rektangler innenfor ``box``."""
+    x0, y0, x1, y1 = box
+    for _ in range(count):
+        ax, bx = sorted(rng.randint(x0, x1) for _ in range(2))
+        ay, by = sorted(rng.randint(y0, y1) for _ in range(2))
+        color = (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255), alpha)
+        if rng.random() < 0.5:
+            draw.ellipse((ax, ay, bx, by), fill=color)
+        else:
+            draw.rectangle((ax, ay, bx, by), fill=color)
+
+
+def transparent_png(rng, size):
+    """Produktbilde med gjennomsiktige kanter av varierende bredde."""
+    w, h = size
+    img = Image.new("RGBA", size, (0, 0, 0, 0))
+    margin_x = rng.randint(w // 20, w // 4)
+    margin_y = rng.randint(h // 20, h // 4)
+    _shapes(ImageDraw.Draw(img), rng, (margin_x, margin_y, w - margin_x, h - margin_y), 40, 255)
+    return img
+
+
+def photo(rng, size):
+    """Fotolignende RGB-bilde: gradient med støy og figurer."""
+    w, h = size
+    base = Image.linear_gradient("L").resize(size).convert("RGB")
+    noise = Image.effect_noise(size, rng.randint(20, 60)).convert("RGB")
+    img = Image.blend(base, noise, 0.35)
+    overlay = Image.new("RGBA", size, (0, 0, 0, 0))
+    _shapes(ImageDraw.Draw(overlay), rng, (0, 0, w, h), 60, 160)
+    img.paste(overlay, (0, 0), overlay)
+    return img
+
+
+def logo(size=(600, 200)):
+    """Enkel gjennomsiktig logo for logoplassering."""
+    img = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    draw.rounded_rectangle((0, 0, size[0] - 1, size[1] - 1), radius=40, fill=(200, 16, 46, 230))
+    draw.text((size[0] // 4, size[1] // 3), "ELOTEC", fill=(255, 255, 255, 255))
+    return img
+
+
+def write_pdf(path, pages, rng):
+    """Skriver en PDF med ``pages`` sider tekst og grafikk."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    can = canvas.Canvas(str(path), pagesize=A4)
+    width, height = A4
+    for number in range(pages):
+        can.setFont("Helvetica-Bold", 18)
+        can.drawString(50, height - 60, f"Datablad side {number + 1}")
+        can.setFont("Helvetica", 10)
+        y = height - 90
+        while y > 60:
+            words = " ".join(f"ord{rng.randint(0, 9999)}" for _ in range(12))
+            can.drawString(50, y, words)
+            y -= 14
+        for _ in range(5):
+            can.rect(rng.uniform(50, width - 150), rng.uniform(60, height - 150),
+                     rng.uniform(20, 100), rng.uniform(20, 100), fill=0)
+        can.showPage()
+    can.save()
+
+
+def build(root, spec=FULL_SPEC):
+    """Bygger korpuset i ``root`` og returnerer en oversikt over filene per type."""
+    root = Path(root)
+    manifest_path = root / "manifest.json"
+    if manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text())
+        if manifest.get("spec") == json.loads(json.dumps(spec)):
+            return manifest["files"]
+
+    root.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(spec["seed"])
+    files = {"transparent_png": [], "large_jpeg": [], "heic": [], "pdf": [], "logo": []}
+
+    logo_path = root / "logo.png"
+    logo().save(logo_path)
+    files["logo"].append(logo_path.name)
+
+    for i in range(spec["transparent_png"]["count"]):
+        path = root / f"transparent_{i:03d}.png"
+        transparent_png(rng, spec["transparent_png"]["size"]).save(path)
+        files["transparent_png"].append(path.name)
+
+    for i in range(spec["large_jpeg"]["count"]):
+        path = root / f"photo_{i:03d}.jpg"
+        photo(rng, spec["large_jpeg"]["size"]).save(path, quality=92)
+        files["large_jpeg"].append(path.name)
+
+    if is_available("pillow_heif") and register_heif():
+        for i in range(spec["heic"]["count"]):
+            path = root / f"photo_{i:03d}.heic"
+            photo(rng, spec["heic"]["size"]).save(path, format="HEIF", quality=85)
+            files["heic"].append(path.name)
+
+    if is_available("reportlab"):
+        for i in range(spec["pdf"]["count"]):
+            path = root / f"document_{i:03d}.pdf"
+            write_pdf(path, spec["pdf"]["pages"], rng)
+            files["pdf"].append(path.name)
+
+    manifest_path.write_text(json.dumps({"spec": spec, "files": files}, indent=2))
+    return files
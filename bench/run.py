@@ -0,0 +1,258 @@
+"""Kjører benchmarkene og sammenligner mot en lagret baseline.
+
+Hvert steg kjøres i en egen prosess, slik at topp-RSS måles per steg og ikke
+påvirkes av stegene før. Resultatet sammenlignes med ``bench/baseline.json``
+og skriptet avslutter med kode 1 hvis et steg er tregere eller bruker mer
+minne enn tersklene tillater.
+
+Bruk:
+    python -m bench.run                    # fullt korpus, sammenlign med baseline
+    python -m bench.run --quick            # lite korpus for rask sjekk
+    python -m bench.run --save-baseline    # lagre resultatet som ny baseline
+    python -m bench.run --stage trim_square --stage pdf_watermark
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from core.telemetry import peak_rss_mb
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+QUICK_BASELINE = Path(__file__).resolve().parent / "baseline-quick.json"
+DEFAULT_CORPUS = Path(tempfile.gettempdir()) / "mastertextweb-bench"
+
+# Tillatt forverring før et steg regnes som en regresjon
+LATENCY_THRESHOLD = 0.15
+THROUGHPUT_THRESHOLD = 0.15
+RSS_THRESHOLD = 0.20
+
+
+def _stage_trim_square(corpus, files):
+    from PIL import Image
+    from core.imaging import make_square, trim_transparent
+
+    def run(name):
+        with Image.open(corpus / name) as image:
+            make_square(trim_transparent(image), 0.1)
+    return files["transparent_png"], run
+
+
+def _stage_overlay_logo(corpus, files):
+    from PIL import Image
+    from core.imaging import overlay_logo
+
+    logo = Image.open(corpus / files["logo"][0])
+    logo.load()
+
+    def run(name):
+        with Image.open(corpus / name) as image:
+            overlay_logo(image, logo, 0.15, 0.8, "Nedre høyre", 20)
+    return files["large_jpeg"], run
+
+
+def _stage_thumbnail(corpus, files):
+    from PIL import Image
+    from core.imaging import make_thumbnail
+    from core.lazy import ensure_heif_for
+
+    def run(name):
+        ensure_heif_for(name)
+        with Image.open(corpus / name) as image:
+            make_thumbnail(image)
+    return files["transparent_png"] + files["large_jpeg"] + files["heic"], run
+
+
+def _stage_heic_decode(corpus, files):
+    from PIL import Image
+    from core.lazy import ensure_heif_for
+
+    def run(name):
+        ensure_heif_for(name)
+        with Image.open(corpus / name) as image:
+            image.load()
+    return files["heic"], run
+
+
+def _encode_stage(output_format, preset, **params):
+    def stage(corpus, files):
+        from PIL import Image
+        from core.encoding import avif_available, encode
+        from core.imaging import make_square, trim_transparent
+
+        # encode() lagrer som WebP uten AVIF-koder; det skal ikke måles som AVIF
+        if output_format.upper() == "AVIF" and not avif_available():
+            return [], None
+
+        # Dekoding og trimming holdes utenfor målingen
+        images = {}
+        for name in files["transparent_png"]:
+            with Image.open(corpus / name) as image:
+                images[name] = make_square(trim_transparent(image), 0.1)
+
+        def run(name):
+            encode(images[name], output_format, preset, **params)
+        return list(images), run
+    return stage
+
+
+def _stage_pdf_watermark(corpus, files):
+    from core.pdf import optimize_pdf
+
+    def run(name):
+        with open(corpus / name, "rb") as source:
+            optimize_pdf(source, article_number="AE2010", add_watermark=True,
+                         compress=True, today="2024-01-01")
+    return files["pdf"], run
+
+
+STAGES = {
+    "trim_square": _stage_trim_square,
+    "overlay_logo": _stage_overlay_logo,
+    "thumbnail": _stage_thumbnail,
+    "heic_decode": _stage_heic_decode,
+    "webp_max": _encode_stage("WebP", "max", quality=100, lossless=True),
+    "webp_fast": _encode_stage("WebP", "fast", quality=90),
+    "webp_target": _encode_stage("WebP", "target", quality=100, target_kb=200),
+    "avif_fast": _encode_stage("AVIF", "fast", quality=70),
+    "pdf_watermark": _stage_pdf_watermark,
+}
+
+
+def _percentile(values, pct):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+def run_stage(name, corpus, repeat):
+    """Kjører ett steg i denne prosessen og returnerer målingene."""
+    corpus = Path(corpus)
+    files = json.loads((corpus / "manifest.json").read_text())["files"]
+    items, run = STAGES[name](corpus, files)
+    if not items:
+        return {"stage": name, "skipped": True}
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            t0 = time.perf_counter()
+            run(item)
+            latencies.append(time.perf_counter() - t0)
+    total = time.perf_counter() - start
+
+    return {
+        "stage": name,
+        "items": len(latencies),
+        "seconds": round(total, 4),
+        "throughput": round(len(latencies) / total, 3),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _run_isolated(name, corpus, repeat):
+    result = subprocess.run(
+        [sys.executable, "-m", "bench.run", "--child", name,
+         "--corpus", str(corpus), "--repeat", str(repeat)],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        return {"stage": name, "error": result.stderr.strip().splitlines()[-1:]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline):
+    """Returnerer en liste med regresjoner i forhold til ``baseline``.
+
+    Et steg som krasjet regnes alltid som en regresjon, og det samme gjør et
+    steg som hoppes over nå, men har målinger i baselinen.
+    """
+    regressions = []
+    for name, current in results.items():
+        if "error" in current:
+            regressions.append(f"{name}: feilet ({' '.join(current['error'])})")
+            continue
+        before = baseline.get(name)
+        if current.get("skipped") and before and not before.get("skipped"):
+            # F.eks. pillow_heif eller AVIF-koder mangler her, men finnes i baselinen
+            regressions.append(f"{name}: hoppet over, men baselinen har målinger")
+            continue
+        if not before or current.get("skipped") or before.get("skipped"):
+            continue
+        if current["p50_ms"] > before["p50_ms"] * (1 + LATENCY_THRESHOLD):
+            regressions.append(f"{name}: p50 {before['p50_ms']} -> {current['p50_ms']} ms")
+        if current["p95_ms"] > before["p95_ms"] * (1 + LATENCY_THRESHOLD):
+            regressions.append(f"{name}: p95 {before['p95_ms']} -> {current['p95_ms']} ms")
+        if current["throughput"] < before["throughput"] * (1 - THROUGHPUT_THRESHOLD):
+            regressions.append(f"{name}: gjennomstrømning {before['throughput']} -> {current['throughput']}/s")
+        if current["peak_rss_mb"] and before.get("peak_rss_mb") \
+                and current["peak_rss_mb"] > before["peak_rss_mb"] * (1 + RSS_THRESHOLD):
+            regressions.append(f"{name}: topp-RSS {before['peak_rss_mb']:.0f} -> {current['peak_rss_mb']:.0f} MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarker for bilde- og PDF-rutinene")
+    parser.add_argument("--stage", action="append", choices=sorted(STAGES),
+                        help="Kjør kun dette steget (kan gjentas)")
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS,
+                        help="Mappe for det genererte korpuset")
+    parser.add_argument("--quick", action="store_true", help="Bruk et lite korpus")
+    parser.add_argument("--repeat", type=int, default=1, help="Antall runder per steg")
+    parser.add_argument("--baseline", type=Path,
+                        help="Baselinefil (standard bench/baseline.json, eller baseline-quick.json med --quick)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Lagre resultatet som ny baseline i stedet for å sammenligne")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_stage(args.child, args.corpus, args.repeat)))
+        return 0
+
+    from bench import corpus
+
+    if args.baseline is None:
+        args.baseline = QUICK_BASELINE if args.quick else BASELINE
+
+    spec = corpus.QUICK_SPEC if args.quick else corpus.FULL_SPEC
+    corpus_dir = args.corpus / ("quick" if args.quick else "full")
+    corpus.build(corpus_dir, spec)
+
+    results = {}
+    for name in args.stage or list(STAGES):
+        results[name] = _run_isolated(name, corpus_dir, args.repeat)
+        print(json.dumps(results[name], ensure_ascii=False))
+
+    failed = [name for name, result in results.items() if "error" in result]
+    if args.save_baseline:
+        if failed:
+            print(f"Baseline ikke lagret; feilet: {', '.join(failed)}", file=sys.stderr)
+            return 1
+        args.baseline.write_text(json.dumps(results, indent=2, ensure_ascii=False) + "\n")
+        print(f"Baseline lagret i {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"Ingen baseline i {args.baseline}; kjør med --save-baseline først.", file=sys.stderr)
+        for name in failed:
+            print(f"FEIL {name}: {' '.join(results[name]['error'])}", file=sys.stderr)
+        return 1 if failed else 0
+
+    regressions = compare(results, json.loads(args.baseline.read_text()))
+    for line in regressions:
+        print(f"REGRESJON {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,6 @@
+"""Delt logikk for Master-verktøyene.
+
+Modulene her importeres av sidene under ``pages/`` og skal være billige å
+importere: tunge avhengigheter lastes først når funksjonen som trenger dem
+faktisk brukes (se ``core.lazy``).
+"""
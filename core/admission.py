@@ -0,0 +1,228 @@
+"""Opptak av bildejobber etter et felles minnebudsjett.
+
+Et 8000x8000-bilde tar 256 MB bare som RGBA, og trimming og kvadrat lager
+flere kopier. Med 8 tråder og 300 filer kan noen få slike bilder sprenge
+containerens minne. Her leses bildehodet først for å anslå hvor mye minne
+behandlingen trenger, og en jobb slippes først til når den får plass i
+budsjettet. Budsjettet deles av alle økter i prosessen.
+
+Jobber som alene er større enn budsjettet slippes til én om gangen, og sidene
+bruker da en sparsom variant av behandlingen (``core.imaging``): stripevis
+trimming på side 2 og logo rett i bildet på side 4.
+"""
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from PIL import Image, UnidentifiedImageError
+
+from core import telemetry
+from core.imaging import LEAN_MODES, STRIP_HEIGHT
+
+ENV_VAR = "MASTER_MEMORY_LIMIT_MB"
+DEFAULT_LIMIT_MB = 2048
+# Andel av containerens minnegrense som kan brukes til dekodede bilder
+CGROUP_FRACTION = 0.6
+# Koderens minnebruk per utpiksel, målt med støybilder (verste tilfelle).
+# AVIF (libaom) bruker mest; WebP med lav method (``fast``) langt mindre.
+ENCODER_BYTES_PER_PIXEL = {"AVIF": 32, "WEBP": 21, "PNG": 5, "JPEG": 5}
+FAST_WEBP_BYTES_PER_PIXEL = 8
+# Ukjent format: samme som én ekstra RGBA-kopi
+DEFAULT_ENCODER_BYTES_PER_PIXEL = 4
+
+_CGROUP_FILES = (
+    "/sys/fs/cgroup/memory.max",                    # cgroup v2
+    "/sys/fs/cgroup/memory/memory.limit_in_bytes",  # cgroup v1
+)
+
+
+def cgroup_limit_bytes():
+    """Containerens minnegrense fra cgroup, eller None hvis den ikke er satt."""
+    for path in _CGROUP_FILES:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # "max" eller et urealistisk stort tall betyr ingen grense
+        if value.isdigit() and int(value) < 1 << 50:
+            return int(value)
+    return None
+
+
+def memory_limit_bytes():
+    """Minnebudsjett fra ``MASTER_MEMORY_LIMIT_MB``, cgroup-grensen eller standard.
+
+    Med cgroup-grense trekkes først fra det resultatlageret kan bruke av RAM
+    (``core.store.memory_bytes``), siden temp-mappen ligger i minnet på Cloud Run.
+    """
+    configured = os.getenv(ENV_VAR)
+    if configured:
+        return int(float(configured) * 1024 * 1024)
+    limit = cgroup_limit_bytes()
+    if limit is not None:
+        from core import store
+
+        return int((limit - store.memory_bytes(limit)) * CGROUP_FRACTION)
+    return DEFAULT_LIMIT_MB * 1024 * 1024
+
+
+def _read_header(file):
+    """Som ``read_header``, men returnerer også om den sparsomme varianten kan brukes."""
+    try:
+        with Image.open(file) as image:
+            header = image.width, image.height, image.mode
+            # Palett og tRNS-gjennomsiktighet gir full vei i core.imaging uansett
+            lean_ok = image.mode in LEAN_MODES and "transparency" not in image.info
+    except (UnidentifiedImageError, OSError, ValueError):
+        header, lean_ok = None, False
+    if hasattr(file, "seek"):
+        file.seek(0)
+    return header, lean_ok
+
+
+def read_header(file):
+    """Returnerer (bredde, høyde, modus) uten å dekode bildet, eller None."""
+    return _read_header(file)[0]
+
+
+def _bytes_per_pixel(mode):
+    if mode in ("I", "F", "I;16", "I;16B", "I;16L"):
+        return 4
+    try:
+        return Image.getmodebands(mode)
+    except (KeyError, ValueError):
+        return 4
+
+
+def _canvas_pixels(width, height, padding_ratio):
+    if padding_ratio is None:
+        return width * height
+    side = int(max(width, height) * (1 + padding_ratio * 2))
+    return side * side
+
+
+def encoder_bytes_per_pixel(output_format=None, preset=None):
+    """Koderens minnebruk per utpiksel for formatet og kodingsmodusen."""
+    if not output_format:
+        return DEFAULT_ENCODER_BYTES_PER_PIXEL
+    fmt = output_format.upper().replace("JPG", "JPEG")
+    if fmt == "WEBP" and preset == "fast":
+        return FAST_WEBP_BYTES_PER_PIXEL
+    return ENCODER_BYTES_PER_PIXEL.get(fmt, DEFAULT_ENCODER_BYTES_PER_PIXEL)
+
+
+def estimate_bytes(width, height, mode, padding_ratio=None, output_format=None, preset=None):
+    """Anslag for vanlig behandling: kilde, RGBA-kopi og utsnitt, lerret og koding.
+
+    ``padding_ratio`` er luften rundt bildet når det gjøres kvadratisk, eller
+    None hvis bildet beholder formatet. ``output_format`` og ``preset`` gir
+    koderens andel; uten dem regnes koding som én RGBA-kopi.
+    """
+    source = width * height * _bytes_per_pixel(mode)
+    rgba = width * height * 4
+    pixels = _canvas_pixels(width, height, padding_ratio)
+    return source + 2 * rgba + pixels * (4 + encoder_bytes_per_pixel(output_format, preset))
+
+
+def estimate_lean_bytes(width, height, mode, padding_ratio=None, output_format=None, preset=None):
+    """Anslag for stripevis behandling: kilde, lerret, koding og én stripe."""
+    source = width * height * _bytes_per_pixel(mode)
+    pixels = _canvas_pixels(width, height, padding_ratio)
+    strip = width * STRIP_HEIGHT * 4
+    return source + pixels * (4 + encoder_bytes_per_pixel(output_format, preset)) + strip
+
+
+class PixelBudget:
+    """Teller minne i bruk og slipper til jobber i FIFO-rekkefølge.
+
+    En jobb slippes til når den er først i køen og får plass. En jobb som er
+    større enn hele budsjettet slippes til alene, når ingenting annet kjører.
+    """
+
+    def __init__(self, limit_bytes):
+        self.limit = limit_bytes
+        self.in_flight = 0
+        self._queue = deque()
+        self._cond = threading.Condition()
+
+    def _fits(self, cost):
+        if self.in_flight == 0:
+            return True
+        return self.in_flight + cost <= self.limit
+
+    def acquire(self, cost):
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+            waited = False
+            while self._queue[0] is not ticket or not self._fits(cost):
+                waited = True
+                self._cond.wait()
+            self._queue.popleft()
+            self.in_flight += cost
+            self._cond.notify_all()
+        if waited:
+            telemetry.count("admission.waited", cost=cost)
+
+    def release(self, cost):
+        with self._cond:
+            self.in_flight -= cost
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, cost):
+        """Holder av ``cost`` byte så lenge blokken kjører."""
+        self.acquire(cost)
+        try:
+            yield
+        finally:
+            self.release(cost)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_budget():
+    """Budsjettet som deles av alle økter i denne prosessen."""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = PixelBudget(memory_limit_bytes())
+    return _shared
+
+
+def cost(file, padding_ratio=None, output_format=None, preset=None):
+    """Anslått minne for vanlig behandling av filen, eller 0 hvis den ikke kan leses."""
+    header = read_header(file)
+    return estimate_bytes(*header, padding_ratio, output_format, preset) if header else 0
+
+
+def plan(file, padding_ratio=None, budget=None, output_format=None, preset=None):
+    """Leser bildehodet og returnerer (kostnad, stripevis) for filen.
+
+    Filer som ikke kan leses får kostnad 0, slik at feilen håndteres av
+    selve behandlingen. Bilder som den sparsomme varianten ikke håndterer
+    (andre moduser enn RGB/RGBA, palett eller tRNS) får full kostnad og
+    slippes til alene hvis de er for store.
+    """
+    budget = budget or shared_budget()
+    header, lean_ok = _read_header(file)
+    if header is None:
+        return 0, False
+    cost = estimate_bytes(*header, padding_ratio, output_format, preset)
+    if cost <= budget.limit or not lean_ok:
+        return cost, False
+    telemetry.count("admission.lean", width=header[0], height=header[1])
+    return estimate_lean_bytes(*header, padding_ratio, output_format, preset), True
+
+
+def submit(executor, budget, cost, fn, *args, **kwargs):
+    """Sender ``fn`` til ``executor`` og lar den vente på plass i budsjettet."""
+    def run():
+        with budget.reserve(cost):
+            return fn(*args, **kwargs)
+    return executor.submit(run)
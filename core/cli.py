@@ -0,0 +1,401 @@
+"""Kommandolinje for bilde- og PDF-behandlingen, uten Streamlit.
+
+Kjører samme logikk som sidene over hele mapper eller glob-mønstre::
+
+    python -m core trim  leverandør/ -o ut/ --format webp --article AE2010R
+    python -m core logo  "bilder/**/*.jpg" -o ut/ --logo logo.png
+    python -m core thumb bilder/ -o ut/ --format jpg
+    python -m core pdf   dokumenter/ -o ut/ --watermark --article AE2010
+    python -m core name  --article AE2010 --doc-type datablad
+
+Filene behandles i en prosesspool og skrives rett til disk. I utmappen
+ligger ``.mastertools-manifest.json`` med innholdshash og innstillinger for
+hver utfil, slik at filer som allerede er behandlet hoppes over neste gang.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
+
+from core import admission, encoding, naming
+from core.lazy import ensure_heif_for
+
+MANIFEST_NAME = ".mastertools-manifest.json"
+# Manifestet skrives til disk etter så mange ferdige filer
+MANIFEST_FLUSH_EVERY = 20
+
+IMAGE_EXTENSIONS = {".png", ".webp", ".jpg", ".jpeg", ".gif", ".bmp", ".tiff", ".tif",
+                    ".avif", ".heic", ".heif"}
+PDF_EXTENSIONS = {".pdf"}
+
+POSITIONS = {
+    "top-left": "Øvre venstre",
+    "top-right": "Øvre høyre",
+    "bottom-left": "Nedre venstre",
+    "bottom-right": "Nedre høyre",
+    "center": "Senter",
+}
+
+
+# --- Arbeidsprosessene ---
+
+@lru_cache(maxsize=4)
+def _load_logo(path):
+    from PIL import Image
+
+    logo = Image.open(path)
+    logo.load()
+    return logo
+
+
+def _open_image(path):
+    from PIL import Image
+    from core.lazy import ensure_heif_for
+
+    ensure_heif_for(path)
+    image = Image.open(path)
+    image.load()
+    return image
+
+
+def _encode(image, params):
+    return encoding.encode(image, params["format"], params["preset"], params["quality"],
+                           params["lossless"], params["target_kb"])
+
+
+def _trim(path, params):
+    from core.imaging import make_square, trim_square_strips, trim_transparent
+
+    image = _open_image(path)
+    if params["lean"]:
+        result = trim_square_strips(image, params["square"], params["padding"])
+    else:
+        result = trim_transparent(image)
+        if params["square"]:
+            result = make_square(result, params["padding"])
+    return _encode(result, params)
+
+
+def _logo(path, params):
+    from core.imaging import overlay_logo
+
+    image = _open_image(path)
+    result = overlay_logo(image, _load_logo(params["logo"]), params["size"], params["opacity"],
+                          POSITIONS[params["position"]], params["logo_padding"], in_place=params["lean"])
+    return _encode(result, params)
+
+
+def _thumb(path, params):
+    from core.imaging import make_thumbnail
+
+    return _encode(make_thumbnail(_open_image(path)), params)
+
+
+def _pdf(path, params):
+    from core.pdf import optimize_pdf
+
+    start = time.perf_counter()
+    with open(path, "rb") as source:
+        data = optimize_pdf(source, params["article"], params["watermark"], params["compress"]).getvalue()
+    return encoding.EncodeResult(data, "PDF", None, time.perf_counter() - start, len(data), 1, None)
+
+
+JOBS = {"trim": _trim, "logo": _logo, "thumb": _thumb, "pdf": _pdf}
+
+
+def run_job(command, src, dest, params):
+    """Behandler ``src`` og skriver resultatet atomisk til ``dest``."""
+    result = JOBS[command](src, params)
+    part = f"{dest}.part"
+    with open(part, "wb") as f:
+        f.write(result.data)
+    os.replace(part, dest)
+    return result._replace(data=b"")
+
+
+# --- Innfiler, manifest og navn ---
+
+def collect_inputs(patterns, extensions, recursive=False, exclude=None):
+    """Finner filer fra mapper og glob-mønstre, sortert og uten duplikater.
+
+    Filer under ``exclude`` (utmappen) tas ikke med, slik at en ny kjøring
+    ikke behandler sine egne utfiler.
+    """
+    found = []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            candidates = path.rglob("*") if recursive else path.iterdir()
+        elif path.is_file():
+            candidates = [path]
+        else:
+            candidates = (Path(p) for p in glob.glob(pattern, recursive=True))
+        found.extend(p for p in candidates if p.is_file() and p.suffix.lower() in extensions)
+    exclude = Path(exclude).resolve() if exclude else None
+    return sorted(p for p in dict.fromkeys(p.resolve() for p in found)
+                  if exclude is None or not p.is_relative_to(exclude))
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 av filen, lest i biter."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def job_key(content_hash, command, params):
+    """Nøkkel for en utfil: innholdshash pluss alle innstillinger."""
+    settings = json.dumps({"command": command, **params}, sort_keys=True, default=str)
+    return f"{content_hash}:{hashlib.sha256(settings.encode()).hexdigest()[:16]}"
+
+
+class Manifest:
+    """Utfilnavn -> jobbnøkkel, lagret i utmappen."""
+
+    def __init__(self, out_dir):
+        self.path = Path(out_dir) / MANIFEST_NAME
+        try:
+            self.entries = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self.entries = {}
+        self._pending = 0
+
+    def is_done(self, out_path, key):
+        return self.entries.get(out_path.name) == key and out_path.exists()
+
+    def record(self, out_path, key):
+        self.entries[out_path.name] = key
+        self._pending += 1
+        if self._pending >= MANIFEST_FLUSH_EVERY:
+            self.save()
+
+    def save(self):
+        part = self.path.with_name(self.path.name + ".part")
+        part.write_text(json.dumps(self.entries, indent=1, ensure_ascii=False))
+        os.replace(part, self.path)
+        self._pending = 0
+
+
+def _output_names(command, sources, params, args):
+    ext = encoding.extension(params["format"].upper().replace("JPG", "JPEG")) \
+        if command != "pdf" else "pdf"
+    names = []
+    for idx, src in enumerate(sources):
+        if command == "trim":
+            names.append(naming.output_name(src.name, idx, ext, args.article or "",
+                                            args.keep_names, args.append_original))
+        elif command == "logo":
+            names.append(f"{src.stem}_logo.{ext}")
+        elif command == "thumb":
+            names.append(f"{src.stem}_250x250.{ext}")
+        else:
+            names.append(f"optimalisert_{src.name}")
+    return names
+
+
+def _collisions(sources, names):
+    """Utfilnavn som flere innfiler ville skrevet til, som {navn: [innfiler]}."""
+    by_name = {}
+    for src, name in zip(sources, names):
+        by_name.setdefault(name, []).append(src)
+    return {name: srcs for name, srcs in by_name.items() if len(srcs) > 1}
+
+
+def _params(command, args):
+    if command == "pdf":
+        return {"article": args.article or "", "watermark": args.watermark, "compress": not args.no_compress}
+
+    output_format = args.format
+    if output_format == "avif" and not encoding.avif_available():
+        print("AVIF-koder mangler; lagrer som WebP.", file=sys.stderr)
+        output_format = "webp"
+    default_quality = {"webp": 100, "avif": 70, "jpg": 95, "png": None}[output_format]
+    params = {
+        "format": output_format,
+        "preset": args.preset,
+        "quality": args.quality if args.quality is not None else default_quality,
+        "lossless": args.lossless,
+        "target_kb": args.target_kb,
+    }
+    if command == "trim":
+        params.update(square=not args.no_square, padding=args.padding / 100, lean=False)
+    elif command == "logo":
+        params.update(logo=str(Path(args.logo).resolve()), size=args.size / 100,
+                      opacity=args.opacity / 100, position=args.position,
+                      logo_padding=args.logo_padding, lean=False)
+    return params
+
+
+def run(command, args):
+    extensions = PDF_EXTENSIONS if command == "pdf" else IMAGE_EXTENSIONS
+    out_dir = Path(args.output)
+    sources = collect_inputs(args.inputs, extensions, args.recursive, exclude=out_dir)
+    if not sources:
+        print("Fant ingen filer å behandle (filer i utmappen tas ikke med).", file=sys.stderr)
+        return 1
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    params = _params(command, args)
+    names = _output_names(command, sources, params, args)
+    # Flere innfiler med samme utnavn ville overskrevet hverandre
+    collisions = _collisions(sources, names)
+    if collisions:
+        print(f"{len(collisions)} utfilnavn brukes av flere innfiler:", file=sys.stderr)
+        for name, srcs in list(collisions.items())[:10]:
+            print(f"  {name}: " + ", ".join(str(src) for src in srcs), file=sys.stderr)
+        print("Gi filene unike navn eller behandle mappene hver for seg.", file=sys.stderr)
+        return 2
+    # Innfiler i utmappen er allerede utelatt; dette fanger f.eks. symlenker til innmappen
+    overwrites = [src for src, name in zip(sources, names) if (out_dir / name).resolve() == src]
+    if overwrites:
+        print(f"{len(overwrites)} utfiler ville overskrevet innfilene, f.eks. {overwrites[0]}. "
+              "Velg en annen utmappe.", file=sys.stderr)
+        return 2
+    manifest = Manifest(out_dir)
+    jobs = args.jobs or os.cpu_count() or 1
+    # Hver prosess får sin del av minnebudsjettet; for store bilder trimmes stripevis
+    worker_budget = admission.PixelBudget(admission.memory_limit_bytes() // jobs)
+
+    # Like filer behandles én gang; resultatet kopieres til de andre navnene
+    pending = {}
+    skipped = 0
+    for src, name in zip(sources, names):
+        out_path = out_dir / name
+        key = job_key(file_hash(src), command, params)
+        if not args.force and manifest.is_done(out_path, key):
+            skipped += 1
+            continue
+        pending.setdefault(key, []).append((src, out_path))
+
+    done = failed = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        for key, targets in pending.items():
+            src, out_path = targets[0]
+            job_params = params
+            # HEIF-støtte må være registrert for at bildehodet skal kunne leses her
+            ensure_heif_for(str(src))
+            if command == "trim":
+                _, lean = admission.plan(str(src), params["padding"] if params["square"] else None,
+                                         worker_budget, params["format"], params["preset"])
+                job_params = dict(params, lean=lean)
+            elif command == "logo":
+                _, lean = admission.plan(str(src), None, worker_budget,
+                                         params["format"], params["preset"])
+                job_params = dict(params, lean=lean)
+            futures[executor.submit(run_job, command, str(src), str(out_path), job_params)] = key
+
+        for future in as_completed(futures):
+            key = futures[future]
+            targets = pending[key]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += len(targets)
+                print(f"feil  {targets[0][0]}: {e}", file=sys.stderr)
+                continue
+            first = targets[0][1]
+            for _, out_path in targets[1:]:
+                shutil.copyfile(first, out_path)
+            for _, out_path in targets:
+                manifest.record(out_path, key)
+                done += 1
+            if not args.quiet:
+                dup = f" (+{len(targets) - 1} duplikater)" if len(targets) > 1 else ""
+                print(f"ok    {first.name}  {encoding.describe(result)}{dup}")
+    manifest.save()
+
+    elapsed = time.perf_counter() - start
+    print(f"{done} behandlet, {skipped} hoppet over, {failed} feilet på {elapsed:.1f} s "
+          f"med {jobs} prosesser.", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def _name(args):
+    try:
+        print(naming.master_text(args.article, args.doc_type, args.rev, args.quality, args.language))
+    except KeyError as e:
+        print(f"Ukjent verdi: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+# --- Argumenter ---
+
+def _add_common(parser):
+    parser.add_argument("inputs", nargs="+", help="Filer, mapper eller glob-mønstre")
+    parser.add_argument("-o", "--output", required=True, help="Utmappe")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Søk i undermapper")
+    parser.add_argument("-j", "--jobs", type=int, help="Antall prosesser (standard: antall kjerner)")
+    parser.add_argument("--force", action="store_true", help="Behandle også filer som er gjort før")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Bare sammendrag")
+
+
+def _add_encoding(parser, formats, default):
+    parser.add_argument("--format", choices=formats, default=default)
+    parser.add_argument("--preset", choices=encoding.PRESETS, default="max")
+    parser.add_argument("--quality", type=int, help="0-100 (standard avhenger av format)")
+    parser.add_argument("--lossless", action="store_true", help="Tapsfri WebP")
+    parser.add_argument("--target-kb", type=int, help="Målstørrelse for --preset target")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m core", description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    trim = sub.add_parser("trim", help="Fjern tomrom og lag kvadratiske bilder (side 2)")
+    _add_common(trim)
+    _add_encoding(trim, ["webp", "png", "avif"], "webp")
+    trim.add_argument("--no-square", action="store_true", help="Ikke gjør bildene kvadratiske")
+    trim.add_argument("--padding", type=float, default=10, help="Luft rundt bildet i prosent")
+    trim.add_argument("--article", help="Artikkelnummer for filnavn, f.eks. AE2010R")
+    trim.add_argument("--keep-names", action="store_true", help="Behold opprinnelige filnavn")
+    trim.add_argument("--append-original", action="store_true",
+                      help="Originalt filnavn etter artikkelnummer")
+
+    logo = sub.add_parser("logo", help="Legg logo på bilder (side 4)")
+    _add_common(logo)
+    _add_encoding(logo, ["webp", "png", "avif"], "webp")
+    logo.add_argument("--logo", required=True, help="Logofil")
+    logo.add_argument("--size", type=float, default=15, help="Logobredde i prosent av bildet")
+    logo.add_argument("--opacity", type=float, default=100, help="Synlighet i prosent")
+    logo.add_argument("--position", choices=sorted(POSITIONS), default="bottom-right")
+    logo.add_argument("--logo-padding", type=int, default=20, help="Avstand fra kant i piksler")
+
+    thumb = sub.add_parser("thumb", help="Konverter til 250x250 (side 6)")
+    _add_common(thumb)
+    _add_encoding(thumb, ["png", "webp", "jpg", "avif"], "png")
+
+    pdf = sub.add_parser("pdf", help="Komprimer og vannmerk PDF (side 5)")
+    _add_common(pdf)
+    pdf.add_argument("--article", help="Artikkelnr for vannmerket")
+    pdf.add_argument("--watermark", action="store_true", help="Legg til vannmerke")
+    pdf.add_argument("--no-compress", action="store_true", help="Ikke komprimer innholdet")
+
+    name = sub.add_parser("name", help="Lag Master-tekst (side 1)")
+    name.add_argument("--article", required=True, help="Artikkelnummer")
+    name.add_argument("--doc-type", required=True, choices=sorted(naming.DOC_TYPES))
+    name.add_argument("--rev", default="R1A", help="Revisjonsnummer")
+    name.add_argument("--quality", choices=sorted(naming.QUALITY_CODES), default="Web")
+    name.add_argument("--language", choices=sorted(naming.LANGUAGE_SUFFIX), default="Norsk")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "name":
+        return _name(args)
+    if args.command == "pdf" and args.watermark and not args.article:
+        print("--watermark krever --article.", file=sys.stderr)
+        return 2
+    return run(args.command, args)
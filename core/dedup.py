@@ -0,0 +1,122 @@
+"""Finner like og nesten like bilder før den tunge behandlingen.
+
+Leverandørmapper og nedlastinger fra nettsider inneholder ofte samme bilde
+flere ganger under forskjellige navn. Like filer (samme SHA-256) behandles én
+gang og fordeles på alle filnavnene. Nesten like filer, f.eks. samme bilde i
+en annen størrelse, finnes med en perseptuell hash (dHash) av et lite
+nedskalert utsnitt og kan vises til brukeren for kontroll.
+"""
+import hashlib
+import io
+from collections import namedtuple
+
+from PIL import Image, UnidentifiedImageError
+
+from core.lazy import ensure_heif_for
+
+# Antall ulike biter (av 64) som fortsatt regnes som nesten likt
+NEAR_THRESHOLD = 6
+# Bildet skaleres først grovt ned til denne størrelsen før hashing
+PROBE_SIZE = (64, 64)
+
+DuplicateGroup = namedtuple("DuplicateGroup", "representative members digest")
+NearDuplicate = namedtuple("NearDuplicate", "first second distance")
+
+
+def read_bytes(file):
+    """Innholdet i en opplastet fil, en filsti-lignende strøm eller bytes."""
+    if isinstance(file, (bytes, bytearray)):
+        return bytes(file)
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    data = file.read()
+    if hasattr(file, "seek"):
+        file.seek(0)
+    return data
+
+
+def content_hash(data):
+    """SHA-256 av innholdet som heksstreng."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def group_exact(files, cache=None):
+    """Grupperer filer med identisk innhold.
+
+    Returnerer ``DuplicateGroup``-er i opplastingsrekkefølge. Første fil i hver
+    gruppe er representanten som skal behandles; ``members`` er alle filene i
+    gruppen, inkludert representanten, som ``(indeks, fil)``. ``digest`` er
+    innholdets SHA-256.
+
+    ``cache`` er en valgfri dict fra Streamlits ``file_id`` til hash, slik at
+    samme opplasting ikke hashes på nytt ved hver kjøring.
+    """
+    groups = {}
+    for idx, file in enumerate(files):
+        file_id = getattr(file, "file_id", None)
+        key = cache.get(file_id) if cache is not None and file_id else None
+        if key is None:
+            key = content_hash(read_bytes(file))
+            if cache is not None and file_id:
+                cache[file_id] = key
+        groups.setdefault(key, []).append((idx, file))
+    return [DuplicateGroup(members[0][1], members, key) for key, members in groups.items()]
+
+
+def perceptual_hash(data, name=""):
+    """64-biters dHash av bildet, eller None hvis det ikke kan leses."""
+    ensure_heif_for(name)
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # draft() lar JPEG-dekoderen skalere ned mens den leser
+            image.draft("RGB", PROBE_SIZE)
+            image.thumbnail(PROBE_SIZE, Image.Resampling.BOX)
+            probe = image.convert("RGBA")
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+    # Gjennomsiktige områder legges på hvitt, så de ikke hashes som svart
+    background = Image.new("RGBA", probe.size, (255, 255, 255, 255))
+    background.alpha_composite(probe)
+    gray = background.convert("L").resize((9, 8), Image.Resampling.BILINEAR)
+    pixels = list(gray.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def hamming(a, b):
+    """Antall ulike biter mellom to hasher."""
+    return bin(a ^ b).count("1")
+
+
+def near_duplicates(files, threshold=NEAR_THRESHOLD):
+    """Finner par av filer med nesten likt innhold.
+
+    ``files`` bør være representantene fra ``group_exact``, slik at identiske
+    filer ikke rapporteres på nytt. Returnerer ``NearDuplicate(første, andre,
+    avstand)`` der første og andre er filnavn.
+    """
+    hashes = []
+    for file in files:
+        name = getattr(file, "name", "")
+        hashes.append((name, perceptual_hash(read_bytes(file), name)))
+    return near_pairs(hashes, threshold)
+
+
+def near_pairs(hashes, threshold=NEAR_THRESHOLD):
+    """Som ``near_duplicates``, men for ferdige ``(filnavn, hash)``-par.
+
+    Hasher som er None (bildet kunne ikke leses) hoppes over.
+    """
+    hashes = [(name, phash) for name, phash in hashes if phash is not None]
+    pairs = []
+    for i, (first, a) in enumerate(hashes):
+        for second, b in hashes[i + 1:]:
+            distance = hamming(a, b)
+            if distance <= threshold:
+                pairs.append(NearDuplicate(first, second, distance))
+    return pairs
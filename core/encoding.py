@@ -0,0 +1,182 @@
+"""Felles lagring av bilder med forhåndsinnstillinger for WebP og AVIF.
+
+* ``max``: høyeste innsats i koderen (WebP ``method=6``, AVIF lav ``speed``),
+  tregest.
+* ``fast``: mye raskere og nesten like små filer.
+* ``target``: søker etter høyeste kvalitet som gir en fil under en
+  målstørrelse, og stopper så snart resultatet er nær nok målet.
+
+AVIF kodes med ``pillow_heif`` når den har en AV1-koder, ellers med Pillows
+egen AVIF-støtte. Finnes ingen av delene, lagres bildet som WebP i stedet.
+
+``encode`` returnerer et ``EncodeResult`` med data, kvalitet, kodetid og
+størrelse, slik at sidene kan vise hva hver fil kostet.
+"""
+import io
+import threading
+import time
+import warnings
+from collections import namedtuple
+
+from PIL import Image
+
+from core.lazy import is_available
+
+PRESETS = ("max", "fast", "target")
+PRESET_LABELS = {
+    "max": "Maks kvalitet (tregest)",
+    "fast": "Rask",
+    "target": "Målstørrelse",
+}
+
+WEBP_METHOD = {"max": 6, "fast": 2, "target": 4}
+# Lavere speed gir mindre filer, men tregere koding (0-10 i Pillow, 0-9 i libheif/aom)
+AVIF_SPEED = {"max": 4, "fast": 8, "target": 7}
+
+EXTENSIONS = {"WEBP": "webp", "AVIF": "avif", "PNG": "png", "JPEG": "jpg"}
+
+# Målstørrelse: godta resultatet når det er mellom 90 % og 100 % av målet
+TARGET_TOLERANCE = 0.9
+TARGET_MAX_ATTEMPTS = 7
+TARGET_MIN_QUALITY = 5
+
+EncodeResult = namedtuple("EncodeResult", "data format quality seconds size attempts met_target")
+
+_avif_lock = threading.Lock()
+_avif_backend = None  # None = ikke sjekket, "" = utilgjengelig
+
+
+def describe(result):
+    """Kort tekst om størrelse og kodetid, f.eks. '182 KB · 41 ms · q=76'."""
+    text = f"{result.size / 1024:.0f} KB · {result.seconds * 1000:.0f} ms"
+    if result.quality is not None:
+        text += f" · q={result.quality}"
+    if result.met_target is False:
+        text += " · over mål"
+    return text
+
+
+def extension(save_format):
+    """Filendelse for et Pillow-format, f.eks. 'JPEG' -> 'jpg'."""
+    return EXTENSIONS.get(save_format, save_format.lower())
+
+
+def _save(image, save_format, **params):
+    buf = io.BytesIO()
+    image.save(buf, format=save_format, **params)
+    return buf.getvalue()
+
+
+def _avif_params(backend, preset, quality):
+    speed = AVIF_SPEED.get(preset, AVIF_SPEED["fast"])
+    if backend == "pillow_heif":
+        return {"quality": quality, "enc_params": {"speed": str(min(speed, 9))}}
+    return {"quality": quality, "speed": speed}
+
+
+def _detect_avif_backend():
+    if is_available("pillow_heif"):
+        import pillow_heif
+
+        register = getattr(pillow_heif, "register_avif_opener", None)
+        if register is not None:
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", DeprecationWarning)
+                    register()
+                _save(Image.new("RGB", (8, 8)), "AVIF", **_avif_params("pillow_heif", "fast", 50))
+                return "pillow_heif"
+            except Exception:
+                pass
+    Image.init()
+    if "AVIF" in Image.SAVE:
+        try:
+            _save(Image.new("RGB", (8, 8)), "AVIF", **_avif_params("pillow", "fast", 50))
+            return "pillow"
+        except Exception:
+            pass
+    return ""
+
+
+def avif_backend():
+    """Returnerer 'pillow_heif', 'pillow' eller '' hvis AVIF ikke kan kodes."""
+    global _avif_backend
+    if _avif_backend is None:
+        with _avif_lock:
+            if _avif_backend is None:
+                _avif_backend = _detect_avif_backend()
+    return _avif_backend
+
+
+def avif_available():
+    """True hvis det finnes en AVIF-koder."""
+    return bool(avif_backend())
+
+
+def _search_target(save, target_bytes, max_quality):
+    """Binærsøk på kvalitet. Returnerer (data, kvalitet, forsøk, traff_målet).
+
+    Søket koder alltid minst én gang, også når ``max_quality`` er under
+    ``TARGET_MIN_QUALITY``.
+    """
+    lo, hi = min(TARGET_MIN_QUALITY, max_quality), max_quality
+    best = smallest = None
+    attempts = 0
+    quality = hi
+    while lo <= hi and attempts < TARGET_MAX_ATTEMPTS:
+        data = save(quality)
+        attempts += 1
+        if len(data) <= target_bytes:
+            best = (data, quality)
+            if len(data) >= target_bytes * TARGET_TOLERANCE:
+                break  # Nær nok målet
+            lo = quality + 1
+        else:
+            if smallest is None or len(data) < len(smallest[0]):
+                smallest = (data, quality)
+            hi = quality - 1
+        quality = (lo + hi) // 2
+    if best is not None:
+        return best[0], best[1], attempts, True
+    return smallest[0], smallest[1], attempts, False
+
+
+def encode(image, output_format="WebP", preset="max", quality=100, lossless=False, target_kb=None):
+    """Koder ``image`` til ``output_format`` ("WebP", "AVIF", "PNG" eller "JPG").
+
+    ``preset`` og ``target_kb`` gjelder WebP og AVIF. I ``target``-modus er
+    ``quality`` øvre grense for søket, og bildet konverteres bare én gang.
+    Uten AVIF-koder lagres bildet som WebP; se ``EncodeResult.format``.
+    """
+    start = time.perf_counter()
+    fmt = output_format.upper()
+    attempts, met_target = 1, None
+
+    if fmt == "AVIF" and not avif_available():
+        fmt = "WEBP"
+
+    if fmt in ("WEBP", "AVIF"):
+        if fmt == "WEBP":
+            def save(q):
+                return _save(image, "WEBP", quality=q, method=WEBP_METHOD.get(preset, 6),
+                             lossless=lossless and preset != "target")
+        else:
+            params = _avif_params(avif_backend(), preset, quality)
+
+            def save(q):
+                return _save(image, "AVIF", **dict(params, quality=q))
+
+        if preset == "target" and target_kb:
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA")
+            data, quality, attempts, met_target = _search_target(save, int(target_kb * 1024), quality)
+        else:
+            data = save(quality)
+    elif fmt in ("JPG", "JPEG"):
+        fmt = "JPEG"
+        data = _save(image.convert("RGB"), fmt, quality=quality)
+    else:
+        data = _save(image, fmt)
+        quality = None
+
+    return EncodeResult(data, fmt, quality, time.perf_counter() - start, len(data), attempts, met_target)
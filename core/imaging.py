@@ -0,0 +1,129 @@
+"""Bildebehandling som brukes av sidene for tomrom, logo og 250x250.
+
+Funksjonene her er rene Pillow-funksjoner uten Streamlit, slik at de kan
+importeres av benchmarkene og andre verktøy.
+"""
+from PIL import Image
+
+THUMBNAIL_SIZE = 250
+THUMBNAIL_BACKGROUND = (248, 250, 252, 255)
+# Høyden på hver stripe i stripevis behandling; minneanslaget i core.admission bruker samme verdi
+STRIP_HEIGHT = 512
+# Moduser de sparsomme variantene håndterer uten å falle tilbake til vanlig vei
+LEAN_MODES = ("RGB", "RGBA")
+
+
+def trim_transparent(image: Image.Image) -> Image.Image:
+    """Beskjærer gjennomsiktige kanter rundt bildet"""
+    img = image.convert("RGBA")
+    bbox = img.getbbox()
+    return img.crop(bbox) if bbox else img
+
+
+def make_square(image: Image.Image, padding_ratio: float = 0.1, bg_color=(0, 0, 0, 0)) -> Image.Image:
+    """Gjør bildet til et kvadrat med gjennomsiktig luft rundt"""
+    w, h = image.size
+    max_side = max(w, h)
+    padded_side = int(max_side * (1 + padding_ratio * 2))  # Luft på alle sider
+
+    square_img = Image.new("RGBA", (padded_side, padded_side), bg_color)
+    x = (padded_side - w) // 2
+    y = (padded_side - h) // 2
+    square_img.paste(image, (x, y))
+
+    return square_img
+
+
+def trim_square_strips(image: Image.Image, make_square_images=True, padding_ratio: float = 0.1,
+                       bg_color=(0, 0, 0, 0), strip_height: int = STRIP_HEIGHT) -> Image.Image:
+    """Som trim_transparent + make_square, men for svært store bilder.
+
+    Beskjæringen finnes fra alfakanalen alene, og bildet konverteres til RGBA
+    stripe for stripe rett inn i lerretet. Da unngås en full RGBA-kopi og et
+    eget utsnitt i minnet.
+    """
+    if image.mode == "P" or "transparency" in image.info:
+        # Gjennomsiktighet ligger i paletten eller info; bruk vanlig vei
+        trimmed = trim_transparent(image)
+        return make_square(trimmed, padding_ratio, bg_color) if make_square_images else trimmed
+
+    if "A" in image.getbands():
+        bbox = image.getchannel("A").getbbox()
+    else:
+        bbox = None  # Ingen gjennomsiktighet å trimme bort
+    left, top, right, bottom = bbox or (0, 0, image.width, image.height)
+    w, h = right - left, bottom - top
+
+    if make_square_images:
+        side = int(max(w, h) * (1 + padding_ratio * 2))
+        canvas = Image.new("RGBA", (side, side), bg_color)
+        x, y = (side - w) // 2, (side - h) // 2
+    else:
+        canvas = Image.new("RGBA", (w, h))
+        x, y = 0, 0
+
+    for strip_top in range(top, bottom, strip_height):
+        strip_bottom = min(strip_top + strip_height, bottom)
+        strip = image.crop((left, strip_top, right, strip_bottom)).convert("RGBA")
+        canvas.paste(strip, (x, y + strip_top - top))
+    return canvas
+
+
+def overlay_logo(image: Image.Image, logo: Image.Image, size_ratio=0.15, opacity=1.0, position="Nedre høyre", padding=20,
+                 in_place=False):
+    """Legger logo på bildet i ønsket posisjon med valgfri gjennomsiktighet.
+
+    Med ``in_place`` legges logoen rett i ``image`` når det er RGB eller RGBA,
+    uten en full RGBA-kopi. Brukes for bilder som er for store for
+    minnebudsjettet; ``image`` endres da.
+    """
+    img = image if in_place and image.mode in LEAN_MODES else image.convert("RGBA")
+    logo = logo.convert("RGBA")
+
+    # Skaler logo
+    logo_width = int(img.width * size_ratio)
+    aspect_ratio = logo.width / logo.height
+    logo_height = int(logo_width / aspect_ratio)
+    logo_resized = logo.resize((logo_width, logo_height), Image.Resampling.LANCZOS)
+
+    # Juster opacity
+    if opacity < 1.0:
+        alpha = logo_resized.getchannel("A")
+        alpha = alpha.point(lambda p: int(p * opacity))
+        logo_resized.putalpha(alpha)
+
+    # Beregn posisjon
+    if position == "Øvre venstre":
+        xy = (padding, padding)
+    elif position == "Øvre høyre":
+        xy = (img.width - logo_resized.width - padding, padding)
+    elif position == "Nedre venstre":
+        xy = (padding, img.height - logo_resized.height - padding)
+    elif position == "Senter":
+        xy = ((img.width - logo_resized.width)//2, (img.height - logo_resized.height)//2)
+    else:  # Nedre høyre
+        xy = (img.width - logo_resized.width - padding, img.height - logo_resized.height - padding)
+
+    img.paste(logo_resized, xy, logo_resized)
+    return img
+
+
+def make_thumbnail(image: Image.Image, size: int = THUMBNAIL_SIZE, bg_color=THUMBNAIL_BACKGROUND) -> Image.Image:
+    """Skalerer bildet ned til size x size og sentrerer det på lys bakgrunn."""
+    # RGBA is safer to work with to preserve transparency.
+    image = image.convert('RGBA')
+
+    # Create a thumbnail (preserves aspect ratio)
+    thumb = image.copy()
+    thumb.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+    # The background should be RGBA to allow pasting a transparent thumb on it.
+    background = Image.new('RGBA', (size, size), bg_color)
+
+    # Paste the thumbnail onto the center of the background
+    paste_position = (
+        (size - thumb.width) // 2,
+        (size - thumb.height) // 2
+    )
+    background.paste(thumb, paste_position, thumb)
+    return background
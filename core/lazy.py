@@ -0,0 +1,72 @@
+"""Lat lasting av tunge avhengigheter.
+
+Sidene importerer ``openai``, ``pypdf``, ``reportlab``, ``bs4``, ``selenium``
+og ``pillow_heif``. Å importere alt dette ved oppstart gjør kaldstart på
+Cloud Run treg, så modulene lastes her først ved første attributtoppslag.
+"""
+import importlib
+import importlib.util
+import threading
+
+HEIF_EXTENSIONS = (".heic", ".heif", ".avif")
+
+_heif_lock = threading.Lock()
+_heif_registered = None  # None = ikke forsøkt, ellers True/False
+
+
+class LazyModule:
+    """Stedfortreder som importerer ``name`` første gang et attributt brukes."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "lastet" if self._module is not None else "ikke lastet"
+        return f"<LazyModule {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    """Returnerer en ``LazyModule`` for ``name`` uten å importere den."""
+    return LazyModule(name)
+
+
+def is_available(name):
+    """Sjekker om en modul kan importeres, uten å importere den."""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def register_heif():
+    """Registrerer HEIF/AVIF-støtte i Pillow én gang. Returnerer True ved suksess."""
+    global _heif_registered
+    if _heif_registered is None:
+        with _heif_lock:
+            if _heif_registered is None:
+                try:
+                    import pillow_heif
+                    pillow_heif.register_heif_opener()
+                    _heif_registered = True
+                except ImportError:
+                    _heif_registered = False
+    return _heif_registered
+
+
+def ensure_heif_for(filename):
+    """Registrerer HEIF-støtte kun hvis ``filename`` er en HEIF/AVIF-fil."""
+    if filename and filename.lower().endswith(HEIF_EXTENSIONS):
+        return register_heif()
+    return False
@@ -0,0 +1,45 @@
+"""Navngiving for Master: dokumenttekst (side 1) og bildefilnavn (side 2)."""
+
+# Dokumenttype -> kode i Master
+DOC_TYPES = {
+    "datablad": "4",
+    "installasjonsmanual": "1",
+    "brukermanual": "0",
+    "forenklet brukerveiledning": "2",
+    "forenklet installasjonsveiledning": "5",
+    "leverandørdokumentasjon": "9",
+    "sertifikat": "151",
+    "egenerklæring": "155",
+    "sikkerhetsdatablad": "153",
+    "godkjenning": "150",
+    "brosjyre": "3",
+    "annet dokument": "",
+}
+
+# Dokumenttyper som ikke får kvalitetskode foran
+NO_QUALITY_PREFIX = {"150", "151", "153", "155"}
+
+QUALITY_CODES = {"Web": "12", "Print": "13", "Stamme": "17"}
+
+LANGUAGE_SUFFIX = {"Norsk": " NO", "Engelsk": " EN", "Ikke språk": ""}
+
+
+def master_text(art_no, doc_text, rev_no="R1A", quality="Web", language="Norsk"):
+    """Lager teksten som limes inn i Master, f.eks. '124¤AE2010 datablad NO¤AE2010¤R1A'.
+
+    Kaster KeyError for ukjent dokumenttype, kvalitet eller språk.
+    """
+    doc_type = DOC_TYPES[doc_text]
+    suffix = LANGUAGE_SUFFIX[language]
+    prefix = doc_type if doc_type in NO_QUALITY_PREFIX else f"{QUALITY_CODES[quality]}{doc_type}"
+    return f"{prefix}¤{art_no} {doc_text}{suffix}¤{art_no}¤{rev_no}"
+
+
+def output_name(file_name, idx, ext, article_number="", keep_original=False, append_original=False):
+    """Bestemmer filnavnet for bilde nr. ``idx`` i opplastingen"""
+    original_name = file_name.rsplit('.', 1)[0]
+    if keep_original or not article_number.strip():
+        return f"{original_name}.{ext}"
+    if append_original:
+        return f"{article_number.strip()}, {original_name}.{ext}"
+    return f"{article_number.strip()}, {idx + 1}.{ext}"
@@ -0,0 +1,74 @@
+"""PDF-komprimering og vannmerking for siden «PDF-optimalisering».
+
+``pypdf`` og ``reportlab`` importeres først når en PDF behandles.
+"""
+from datetime import date
+from io import BytesIO
+
+from core import telemetry
+
+WATERMARK_TEXT = "Elotec AS - kun for intern bruk."
+
+
+def watermark_lines(article_number, today=None):
+    """Returnerer de to tekstlinjene i vannmerket."""
+    today = today or date.today().isoformat()
+    return WATERMARK_TEXT, f"Artikkelnr {article_number} {today}"
+
+
+def make_watermark_page(page_width, page_height, lines):
+    """Tegner vannmerket på en tom side med samme størrelse og returnerer den."""
+    from pypdf import PdfReader
+    from reportlab.pdfgen import canvas
+
+    line1, line2 = lines
+    packet = BytesIO()
+    can = canvas.Canvas(packet, pagesize=(page_width, page_height))
+    can.saveState()
+    can.translate(page_width / 2, page_height / 2)
+    can.rotate(45)
+
+    can.setFont("Helvetica", 40)
+
+    try:
+        can.setFillAlpha(0.3)
+    except Exception:
+        pass
+
+    can.drawCentredString(0, 20, line1)
+    can.drawCentredString(0, -20, line2)
+
+    can.restoreState()
+    can.save()
+    packet.seek(0)
+    return PdfReader(packet).pages[0]
+
+
+def optimize_pdf(source, article_number="", add_watermark=False, compress=True, today=None):
+    """Komprimerer og/eller vannmerker ``source`` og returnerer en ``BytesIO``."""
+    from pypdf import PdfReader, PdfWriter
+
+    with telemetry.span("pdf.read") as span:
+        reader = PdfReader(source)
+        span.set(pages=len(reader.pages))
+    writer = PdfWriter()
+    lines = watermark_lines(article_number, today)
+    with telemetry.span("pdf.pages", pages=len(reader.pages), watermark=add_watermark, compress=compress):
+        for page in reader.pages:
+            page_width = float(page.mediabox.width)
+            page_height = float(page.mediabox.height)
+            if add_watermark:
+                page.merge_page(make_watermark_page(page_width, page_height, lines))
+            if compress:
+                try:
+                    page.compress_content_streams()
+                except Exception:
+                    pass
+            writer.add_page(page)
+    writer.add_metadata(reader.metadata or {})
+    output = BytesIO()
+    with telemetry.span("pdf.write") as span:
+        writer.write(output)
+        span.add_bytes(out=output.tell())
+    output.seek(0)
+    return output
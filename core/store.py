@@ -0,0 +1,315 @@
+"""Diskbasert lager for ferdig behandlede filer, delt mellom økter og prosesser.
+
+Resultater lagres under en nøkkel laget av innholdshashen til kildefilen og
+innstillingene, slik at samme bilde med samme innstillinger bare behandles
+én gang, også etter en omstart. Sidene holder bare et lett ``Handle`` og
+leser dataene fra disk når de trengs.
+
+* Hver oppføring har en levetid (TTL) og slettes når den har gått ut.
+* Når lageret blir større enn grensen, slettes de minst nylig brukte
+  oppføringene først (LRU, etter filens mtime som oppdateres ved treff).
+  Oppføringer brukt de siste ``MIN_AGE`` sekundene slettes ikke, så en
+  kjørende bunke ikke mister sine egne filer; lageret kan da midlertidig
+  bli opptil ``HARD_LIMIT_FACTOR`` ganger større enn grensen.
+* Skriving skjer via en midlertidig fil og ``os.replace``, og rydding tar en
+  fillås, så flere prosesser kan bruke samme mappe samtidig.
+
+Innstillinger: ``MASTER_STORE_DIR``, ``MASTER_STORE_MAX_MB`` og
+``MASTER_STORE_TTL_HOURS``.
+
+Uten ``MASTER_STORE_DIR`` ligger lageret i temp-mappen. På Cloud Run er den
+et minnebasert filsystem, så alt som lagres bruker containerens RAM. Da er
+standardgrensen høyst ``TMP_CGROUP_FRACTION`` av minnegrensen, og
+minnebudsjettet i ``core.admission`` trekker fra det samme beløpet. Pek
+``MASTER_STORE_DIR`` til et montert volum for å lagre mer uten å bruke RAM.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows; rydding skjer da uten lås
+    fcntl = None
+
+DEFAULT_DIR = Path(tempfile.gettempdir()) / "mastertextweb-store"
+DEFAULT_MAX_MB = 2048
+DEFAULT_TTL_HOURS = 24
+# Andel av containerens minnegrense lageret kan bruke når det ligger i temp-mappen
+TMP_CGROUP_FRACTION = 0.2
+# Lengste side på forhåndsvisningene sidene viser i stedet for fullstørrelse
+PREVIEW_SIZE = 320
+# Rydd når det er skrevet mer enn denne andelen av grensen siden sist
+EVICT_FRACTION = 0.05
+# Oppføringer brukt nyere enn dette (sekunder) beskyttes mot LRU-sletting
+MIN_AGE = 15 * 60
+# ... men bare til lageret er så mange ganger større enn grensen
+HARD_LIMIT_FACTOR = 1.5
+
+_META_SUFFIX = ".json"
+
+
+class Handle:
+    """Lett referanse til en lagret fil. Trygt å holde i økten og å pickle."""
+
+    __slots__ = ("key", "path", "size", "meta")
+
+    def __init__(self, key, path, size, meta):
+        self.key = key
+        self.path = path
+        self.size = size
+        self.meta = meta
+
+    def exists(self):
+        """True hvis dataene fortsatt ligger på disk."""
+        return os.path.exists(self.path)
+
+    def read(self):
+        """Leser dataene, eller None hvis oppføringen er slettet i mellomtiden."""
+        try:
+            with open(self.path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def __repr__(self):
+        return f"<Handle {self.key[:12]} {self.size} B>"
+
+
+class ResultStore:
+    def __init__(self, root=DEFAULT_DIR, max_bytes=DEFAULT_MAX_MB * 1024 * 1024,
+                 ttl=DEFAULT_TTL_HOURS * 3600, min_age=MIN_AGE):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.min_age = min_age
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._written = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(content_hash, params):
+        """Nøkkel av innholdshash og innstillinger (alt som påvirker resultatet)."""
+        settings = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256(f"{content_hash}\0{settings}".encode()).hexdigest()
+
+    def _paths(self, key):
+        folder = self.root / key[:2]
+        return folder / key, folder / (key + _META_SUFFIX)
+
+    def get(self, key):
+        """Returnerer et ``Handle`` for ``key``, eller None hvis den mangler eller er utløpt."""
+        data_path, meta_path = self._paths(key)
+        try:
+            meta = json.loads(meta_path.read_text())
+            size = data_path.stat().st_size
+        except (OSError, ValueError):
+            return None
+        if meta.get("expires", 0) < time.time():
+            self._remove(key)
+            return None
+        try:
+            os.utime(data_path)  # Markerer oppføringen som nylig brukt
+        except OSError:
+            return None
+        return Handle(key, str(data_path), size, meta.get("meta", {}))
+
+    def put(self, key, data, meta=None, ttl=None):
+        """Lagrer ``data`` under ``key`` og returnerer et ``Handle``."""
+        return self.put_stream(key, lambda f: f.write(data), meta, ttl)
+
+    def put_stream(self, key, write, meta=None, ttl=None):
+        """Som ``put``, men ``write(fil)`` skriver dataene rett til disk."""
+        data_path, meta_path = self._paths(key)
+        data_path.parent.mkdir(exist_ok=True)
+        record = {"expires": time.time() + (ttl or self.ttl), "meta": meta or {}}
+        self._atomic_write(data_path, write)
+        self._atomic_write(meta_path, lambda f: f.write(json.dumps(record, ensure_ascii=False).encode()))
+        size = data_path.stat().st_size
+
+        with self._lock:
+            self._written += size
+            due = self._written >= self.max_bytes * EVICT_FRACTION
+            if due:
+                self._written = 0
+        if due:
+            self.evict()
+        return Handle(key, str(data_path), size, record["meta"])
+
+    @staticmethod
+    def _atomic_write(path, write):
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def _remove(self, key):
+        for path in self._paths(key):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _entries(self):
+        """(key, størrelse, sist brukt, utløper) for alle oppføringer."""
+        for folder in self.root.iterdir():
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder):
+                if entry.name.startswith(".") or entry.name.endswith(_META_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                    meta = json.loads(Path(entry.path + _META_SUFFIX).read_text())
+                except (OSError, ValueError):
+                    continue  # Under skriving eller allerede slettet
+                yield entry.name, stat.st_size, stat.st_mtime, meta.get("expires", 0)
+
+    def evict(self):
+        """Sletter utløpte oppføringer, deretter de minst brukte til lageret er under grensen.
+
+        Oppføringer brukt de siste ``min_age`` sekundene beholdes, så lenge
+        lageret er under ``HARD_LIMIT_FACTOR`` ganger grensen. Bare én
+        prosess rydder om gangen; andre hopper over.
+        """
+        with open(self.root / ".lock", "a") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return
+            now = time.time()
+            live = []
+            for key, size, used, expires in self._entries():
+                if expires < now:
+                    self._remove(key)
+                else:
+                    live.append((used, size, key))
+            total = sum(size for _, size, _ in live)
+            protected = now - self.min_age
+            hard_limit = self.max_bytes * HARD_LIMIT_FACTOR
+            for used, size, key in sorted(live):
+                if total <= self.max_bytes or (used > protected and total <= hard_limit):
+                    break
+                self._remove(key)
+                total -= size
+
+
+def zip_key(entries):
+    """Nøkkelen ``build_zip`` bruker for ``(filnavn, handle)``-parene."""
+    return ResultStore.key("zip", [(name, handle.key) for name, handle in entries])
+
+
+def _on_volume():
+    """True hvis lageret er lagt på en egen mappe, antatt å være et ekte volum."""
+    return bool(os.getenv("MASTER_STORE_DIR"))
+
+
+def default_max_bytes(cgroup_limit=None):
+    """Lagerets størrelsesgrense fra ``MASTER_STORE_MAX_MB`` eller standard.
+
+    I temp-mappen er standarden høyst ``TMP_CGROUP_FRACTION`` av
+    containerens minnegrense.
+    """
+    configured = os.getenv("MASTER_STORE_MAX_MB")
+    if configured:
+        return int(float(configured) * 1024 * 1024)
+    default = DEFAULT_MAX_MB * 1024 * 1024
+    if _on_volume():
+        return default
+    if cgroup_limit is None:
+        from core.admission import cgroup_limit_bytes
+
+        cgroup_limit = cgroup_limit_bytes()
+    return min(default, int(cgroup_limit * TMP_CGROUP_FRACTION)) if cgroup_limit else default
+
+
+def memory_bytes(cgroup_limit=None):
+    """Hvor mye RAM lageret kan bruke: hele grensen i temp-mappen, ellers 0."""
+    return 0 if _on_volume() else default_max_bytes(cgroup_limit)
+
+
+def preview(handle, size=PREVIEW_SIZE, result_store=None):
+    """Liten WebP-forhåndsvisning av en lagret fil, eller None hvis den ikke kan lages.
+
+    Forhåndsvisningen lagres selv i lageret, så bildet dekodes bare første gang.
+    """
+    result_store = result_store or shared_store()
+    key = ResultStore.key(handle.key, {"preview": size})
+    cached = result_store.get(key)
+    data = cached.read() if cached is not None else None
+    if data:
+        return data
+
+    import io
+
+    from PIL import Image, UnidentifiedImageError
+
+    from core.lazy import ensure_heif_for
+
+    ensure_heif_for(f"preview.{handle.meta.get('ext', '')}")
+    try:
+        with Image.open(handle.path) as image:
+            # draft() lar JPEG-dekoderen skalere ned mens den leser
+            image.draft("RGB", (size, size))
+            image.thumbnail((size, size))
+            buf = io.BytesIO()
+            image.save(buf, format="WEBP", quality=80)
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+    data = buf.getvalue()
+    result_store.put(key, data, meta={"preview": size})
+    return data
+
+
+def build_zip(entries, result_store=None):
+    """Pakker ``(filnavn, handle)`` i en ZIP i lageret og returnerer et ``Handle``.
+
+    Filene leses fra disk én om gangen, og samme innhold gir samme ZIP, så
+    den bare bygges én gang. Filer som er slettet underveis hoppes over.
+    """
+    result_store = result_store or shared_store()
+    key = zip_key(entries)
+    handle = result_store.get(key)
+    if handle is not None:
+        return handle
+
+    def write(f):
+        with zipfile.ZipFile(f, "w") as zip_file:
+            for name, entry in entries:
+                try:
+                    zip_file.write(entry.path, name)
+                except FileNotFoundError:
+                    continue  # Slettet mens ZIP-en ble bygget
+
+    return result_store.put_stream(key, write, meta={"files": len(entries)})
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_store():
+    """Lageret som deles av alle økter, konfigurert fra miljøvariabler."""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = ResultStore(
+                    os.getenv("MASTER_STORE_DIR") or DEFAULT_DIR,
+                    default_max_bytes(),
+                    float(os.getenv("MASTER_STORE_TTL_HOURS", DEFAULT_TTL_HOURS)) * 3600,
+                )
+    return _shared
@@ -0,0 +1,288 @@
+"""Lett instrumentering av behandlingsstegene, eksportert som strukturerte logger.
+
+Bruk ``span`` rundt et steg og ``count`` for tellere::
+
+    with telemetry.span("bildetomrom.encode", file=name) as s:
+        image.save(buf, format="WEBP")
+        s.add_bytes(out=buf.tell())
+
+Hver span registrerer veggtid, CPU-tid for tråden, bytes inn/ut og
+prosessens RSS når steget er ferdig, pluss hvor mye topp-RSS økte under
+steget. Spans rundt en hel bunke åpnes med ``process=True``; de måler CPU-tid
+for hele prosessen (også arbeidertrådene) og nullstiller topp-RSS ved start,
+slik at ``peak_rss_mb`` gjelder bunken og ikke hele prosessens levetid.
+Hvor postene havner styres av miljøvariabelen ``MASTER_TELEMETRY``:
+
+* ``off`` (standard): ingenting registreres, ``span`` returnerer et delt
+  tomt objekt.
+* ``stdout``: én JSON-linje per post på stdout.
+* ``cloud``: strukturerte JSON-linjer på stdout i Cloud Loggings format
+  (``google-cloud-logging``), som Cloud Run samler opp uten egne API-kall.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+
+ENV_VAR = "MASTER_TELEMETRY"
+LOGGER_NAME = "mastertextweb"
+
+_sink = None
+_configured = False
+_configure_lock = threading.Lock()
+
+# Topp-RSS nullstilles bare når ingen annen prosess-span kjører; generasjonen
+# øker ved hver nullstilling, slik at spans som overlapper den kan merkes
+_peak_lock = threading.Lock()
+_process_spans = 0
+_peak_generation = 0
+
+
+def _memory_mb():
+    """Returnerer (rss, topp-rss) i MB for prosessen, eller (None, None)."""
+    rss = peak = None
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) / 1024
+    except OSError:
+        try:
+            import resource
+        except ImportError:
+            return None, None
+        # ru_maxrss er i KiB på Linux og byte på macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+    return rss, peak
+
+
+def _reset_peak():
+    """Nullstiller prosessens topp-RSS (VmHWM). True hvis det lyktes."""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _begin_process_span():
+    """Registrerer en prosess-span og nullstiller topp-RSS hvis den er alene."""
+    global _process_spans, _peak_generation
+    with _peak_lock:
+        _process_spans += 1
+        if _process_spans == 1 and _reset_peak():
+            _peak_generation += 1
+            return True
+    return False
+
+
+def _end_process_span():
+    global _process_spans
+    with _peak_lock:
+        _process_spans -= 1
+
+
+def peak_rss_mb():
+    """Prosessens høyeste RSS hittil i MB."""
+    return _memory_mb()[1]
+
+
+class JsonSink:
+    """Skriver hver post som én JSON-linje."""
+
+    def __init__(self, stream=None):
+        self._stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self._stream.write(line + "\n")
+            self._stream.flush()
+
+
+class CloudLoggingSink:
+    """Skriver postene som strukturerte Cloud Logging-linjer på stdout.
+
+    Cloud Run sender stdout videre til Cloud Logging, så hver post koster en
+    lokal skriving i stedet for et blokkerende API-kall fra arbeidertrådene.
+    """
+
+    def __init__(self, logger_name=LOGGER_NAME, stream=None):
+        from google.cloud.logging.handlers import StructuredLogHandler
+
+        self._logger = logging.getLogger(logger_name)
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        if not any(isinstance(h, StructuredLogHandler) for h in self._logger.handlers):
+            self._logger.addHandler(StructuredLogHandler(stream=stream or sys.stdout))
+
+    def emit(self, record):
+        name = record.get("span") or record.get("counter", "")
+        self._logger.info(f"{record['type']} {name}", extra={"json_fields": record})
+
+
+class Span:
+    """Ett målt steg. Opprettes via ``span``."""
+
+    __slots__ = ("name", "fields", "process", "bytes_in", "bytes_out", "_id", "_wall", "_cpu",
+                 "_peak", "_clock", "_generation", "_reset")
+
+    def __init__(self, name, fields, process=False):
+        self.name = name
+        self.fields = fields
+        self.process = process
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._id = uuid.uuid4().hex[:16]
+
+    def add_bytes(self, inp=0, out=0):
+        """Legger til bytes lest inn og skrevet ut i steget."""
+        self.bytes_in += inp
+        self.bytes_out += out
+
+    def set(self, **fields):
+        """Legger til eller overskriver felter på posten."""
+        self.fields.update(fields)
+
+    def __enter__(self):
+        # En bunke venter på arbeidertrådene, så den må måle CPU-tid for hele prosessen
+        self._clock = time.process_time if self.process else time.thread_time
+        self._reset = _begin_process_span() if self.process else False
+        self._generation = _peak_generation
+        self._peak = _memory_mb()[1]
+        self._wall = time.perf_counter()
+        self._cpu = self._clock()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        cpu = self._clock() - self._cpu
+        rss, peak = _memory_mb()
+        if self.process:
+            _end_process_span()
+        # En annen span kan ha nullstilt topp-RSS underveis; da er økningen ukjent
+        peak_reset = _peak_generation != self._generation
+        growth = None
+        if peak is not None and self._peak is not None and not peak_reset:
+            growth = round(max(peak - self._peak, 0.0), 1)
+        record = {
+            "type": "span",
+            "span": self.name,
+            "span_id": self._id,
+            "wall_ms": round(wall * 1000, 3),
+            "cpu_ms": round(cpu * 1000, 3),
+            "cpu_scope": "process" if self.process else "thread",
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "rss_mb": rss,
+            "peak_rss_mb": peak,
+            "peak_rss_growth_mb": growth,
+            "peak_rss_reset": self._reset,
+            "peak_rss_reset_during": peak_reset,
+            "ok": exc_type is None,
+        }
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        record.update(self.fields)
+        _emit(record)
+        return False
+
+
+class _NoopSpan:
+    """Delt tomt objekt som brukes når instrumenteringen er av."""
+
+    __slots__ = ()
+
+    def add_bytes(self, inp=0, out=0):
+        pass
+
+    def set(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def _sink_from_env():
+    mode = os.getenv(ENV_VAR, "off").strip().lower()
+    if mode == "stdout":
+        return JsonSink()
+    if mode == "cloud":
+        try:
+            return CloudLoggingSink()
+        except Exception as e:  # mangler pakke eller legitimasjon
+            print(f"{ENV_VAR}=cloud: Cloud Logging utilgjengelig ({e}), bruker stdout",
+                  file=sys.stderr)
+            return JsonSink()
+    return None
+
+
+def configure(sink=None):
+    """Setter hvor postene sendes. ``None`` slår instrumenteringen av."""
+    global _sink, _configured
+    with _configure_lock:
+        _sink = sink
+        _configured = True
+
+
+def _current_sink():
+    global _sink, _configured
+    if not _configured:
+        with _configure_lock:
+            if not _configured:
+                _sink = _sink_from_env()
+                _configured = True
+    return _sink
+
+
+def enabled():
+    """True hvis poster faktisk sendes et sted."""
+    return _current_sink() is not None
+
+
+def _emit(record):
+    sink = _current_sink()
+    if sink is None:
+        return
+    record["ts"] = time.time()
+    try:
+        sink.emit(record)
+    except Exception:
+        # Instrumenteringen skal aldri stoppe selve behandlingen
+        pass
+
+
+def span(name, process=False, **fields):
+    """Context manager som måler et steg. Ekstra nøkkelord blir felter på posten.
+
+    ``process=True`` er for spans rundt en hel bunke: CPU-tid for alle tråder,
+    og topp-RSS nullstilles ved start hvis ingen annen bunke kjører
+    (``peak_rss_reset``). Spans som overlapper en nullstilling får
+    ``peak_rss_reset_during`` og ingen ``peak_rss_growth_mb``.
+    """
+    if _current_sink() is None:
+        return _NOOP
+    return Span(name, fields, process)
+
+
+def count(name, value=1, **fields):
+    """Registrerer en teller, f.eks. antall filer eller avviste filer."""
+    if _current_sink() is None:
+        return
+    record = {"type": "counter", "counter": name, "value": value}
+    record.update(fields)
+    _emit(record)
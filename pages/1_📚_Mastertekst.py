@@ -1,5 +1,7 @@
 import streamlit as st
 
+from core import naming
+
 st.set_page_config(page_title="Master-tekst",page_icon=":robot_face:",)
 
 
@@ -29,25 +31,25 @@ docType = st.radio(
         "Master håndterer de fleste dokumenter. Om du ikke finner riktig kategori her, kan du se vår interne dokumentmodell. Den finnes på siden for opplasting på Master.",
     ],
 )
-# Mapping of document types to code and description
+# Mapping of document types to description; codes are in core.naming
 doc_type_map = {
-    "Datablad :ledger:": ("4", "datablad"),
-    "Installasjonsmanual :open_book:": ("1", "installasjonsmanual"),
-    "Brukermanual :closed_book:": ("0", "brukermanual"),
-    "Forenklet brukerveiledning  :clock9:": ("2", "forenklet brukerveiledning"),
-    "Forenklet installasjonsveiledning :japan:": ("5", "forenklet installasjonsveiledning"),
-    "Leverandørdokumentasjon :file_folder:": ("9", "leverandørdokumentasjon"),
-    "Sertifikat :bookmark_tabs:": ("151", "sertifikat"),
-    "Egenerklæring :memo:": ("155", "egenerklæring"),
-    "Sikkerhetsdatablad :warning:": ("153", "sikkerhetsdatablad"),
-    "Godkjenning :ballot_box_with_check:": ("150", "godkjenning"),
-    "Brosjyre  :chart_with_upwards_trend:": ("3", "brosjyre"),
-    "Annet dokument :page_facing_up:": ("", "annet dokument"),  # Default placeholder
+    "Datablad :ledger:": "datablad",
+    "Installasjonsmanual :open_book:": "installasjonsmanual",
+    "Brukermanual :closed_book:": "brukermanual",
+    "Forenklet brukerveiledning  :clock9:": "forenklet brukerveiledning",
+    "Forenklet installasjonsveiledning :japan:": "forenklet installasjonsveiledning",
+    "Leverandørdokumentasjon :file_folder:": "leverandørdokumentasjon",
+    "Sertifikat :bookmark_tabs:": "sertifikat",
+    "Egenerklæring :memo:": "egenerklæring",
+    "Sikkerhetsdatablad :warning:": "sikkerhetsdatablad",
+    "Godkjenning :ballot_box_with_check:": "godkjenning",
+    "Brosjyre  :chart_with_upwards_trend:": "brosjyre",
+    "Annet dokument :page_facing_up:": "annet dokument",  # Default placeholder
 }
 
 # Look up selected document type; stop execution on unexpected values
-docType, docText = doc_type_map.get(docType, (None, None))
-if docType is None:
+docText = doc_type_map.get(docType)
+if docText is None:
     st.error("En uventet feil har oppstått. Vennligst prøv igjen.")
     st.stop()
 
@@ -65,12 +67,6 @@ quality = st.radio(
         "Ofte redigerbare dokument som .docx, .indd osv.",]
 )
 
-if quality == "Web":
-    quality = "12" 
-elif quality == "Print":
-    quality = "13"
-elif quality == "Stamme":
-    quality = "17"
 st.write("#### Språk")
 språk = st.radio(
     "Velg språket som er brukt i dokumentet.",
@@ -82,16 +78,6 @@ språk = st.radio(
     ]
 )
 
-if språk == "Norsk":
-    språk = " NO"
-elif språk == "Engelsk":
-    språk = " EN"
-else:
-    språk = ""  # Ikke spesifisert språk
-
-if docType in ["150", "151", "153", "155"]:
-    toBeCopy = (f"{docType}¤{artNo} {docText}{språk}¤{artNo}¤{revNo}")
-else:
-    toBeCopy = (f"{quality}{docType}¤{artNo} {docText}{språk}¤{artNo}¤{revNo}")
+toBeCopy = naming.master_text(artNo, docText, revNo, quality, språk)
 
 st.code(toBeCopy, language="text")
\ No newline at end of file
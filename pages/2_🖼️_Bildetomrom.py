@@ -1,40 +1,61 @@
 import streamlit as st
 from PIL import Image, UnidentifiedImageError
-import io, zipfile
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# Registrer HEIF/AVIF-støtte hvis tilgjengelig
-try:
-    import pillow_heif
-    pillow_heif.register_heif_opener()
-except ImportError:
-    pass
+from core import admission, dedup, encoding, store, telemetry
+from core.imaging import make_square, trim_square_strips, trim_transparent
+from core.lazy import ensure_heif_for
+from core.naming import output_name
 
 st.title("🖼️ Fjern tomrommet på kantene av bilder og konverter")
+
+# Antall forhåndsvisninger per side; bare disse lastes inn ved hver kjøring
+PREVIEWS_PER_PAGE = 12
 st.sidebar.header("Innstillinger")
 
 # Velg utdataformat
 output_format = st.sidebar.radio(
     "Velg nedlastingsformat",
-    ["WebP", "PNG"],
+    ["WebP", "PNG", "AVIF"],
     index=0,
-    help="WebP gir mindre filer, PNG gir maks kompatibilitet"
+    help="WebP gir mindre filer, PNG gir maks kompatibilitet, AVIF gir minst filer for fotografier"
 )
+if output_format == "AVIF" and not encoding.avif_available():
+    st.sidebar.warning("AVIF-koder mangler på serveren. Bildene lagres som WebP.")
+    output_format = "WebP"
 
-# Slider for WebP-kvalitet (vises kun hvis WebP valgt)
+# Kodingsmodus og kvalitet (vises kun for WebP og AVIF)
 webp_lossless = False
-if output_format == "WebP":
-    webp_quality = st.sidebar.slider(
-        "Velg WebP-kvalitet",
+encode_preset = "max"
+target_kb = None
+if output_format in ("WebP", "AVIF"):
+    encode_preset = st.sidebar.radio(
+        "Kodingsmodus",
+        encoding.PRESETS,
+        format_func=encoding.PRESET_LABELS.get,
+        index=0,
+        help="Maks kvalitet bruker mest tid på komprimering. Rask er mange ganger raskere med litt større filer. Målstørrelse finner høyeste kvalitet under valgt filstørrelse."
+    )
+    if encode_preset == "target":
+        target_kb = st.sidebar.number_input(
+            "Maks filstørrelse (KB)",
+            min_value=10,
+            max_value=10000,
+            value=200,
+            step=10
+        )
+    image_quality = st.sidebar.slider(
+        f"Velg {output_format}-kvalitet" if encode_preset != "target" else f"Høyeste {output_format}-kvalitet",
         min_value=0,
         max_value=100,
-        value=100,
+        value=100 if output_format == "WebP" else 70,
         step=1,
         help="Lavere verdi gir mindre filer, men lavere bildekvalitet"
     )
-    webp_lossless = st.sidebar.checkbox("Lossless komprimering", value=True, help="Gir perfekt bildekvalitet, men større filer enn \'lossy\'. Kvalitetsslideren styrer da komprimeringsgraden.")
+    if output_format == "WebP" and encode_preset != "target":
+        webp_lossless = st.sidebar.checkbox("Lossless komprimering", value=True, help="Gir perfekt bildekvalitet, men større filer enn \'lossy\'. Kvalitetsslideren styrer da komprimeringsgraden.")
 else:
-    webp_quality = 100  # Brukes for internprosessering
+    image_quality = 100  # Brukes for internprosessering
 
 # Mulighet for kvadratiske bilder med luft
 make_square_images = st.sidebar.checkbox("Lag kvadratiske bilder med luft", value=True)
@@ -71,142 +92,222 @@ append_original_after_article = st.sidebar.checkbox(
 if append_original_after_article:
     keep_original_names = False
 
+flag_near_duplicates = st.sidebar.checkbox(
+    "Marker nesten like bilder",
+    value=False,
+    help="Like filer behandles alltid bare én gang. Dette viser i tillegg bilder som ser nesten like ut, f.eks. samme bilde i en annen størrelse."
+)
+
 uploaded_files = st.file_uploader(
     "Last opp opptil 300 bilder (.png, .jpg, .jpeg, .gif, .bmp, .tiff, .tif, .webp, .avif, .heic, .heif)",
     type=["png", "webp", "jpg", "jpeg", "gif", "bmp", "tiff", "tif", "avif", "heic", "heif"],
     accept_multiple_files=True
 )
 
-def trim_transparent(image: Image.Image) -> Image.Image:
-    """Beskjærer gjennomsiktige kanter rundt bildet"""
-    img = image.convert("RGBA")
-    bbox = img.getbbox()
-    return img.crop(bbox) if bbox else img
-
-def make_square(image: Image.Image, padding_ratio: float = 0.1, bg_color=(0, 0, 0, 0)) -> Image.Image:
-    """Gjør bildet til et kvadrat med gjennomsiktig luft rundt"""
-    w, h = image.size
-    max_side = max(w, h)
-    padded_side = int(max_side * (1 + padding_ratio * 2))  # Luft på alle sider
-
-    square_img = Image.new("RGBA", (padded_side, padded_side), bg_color)
-    x = (padded_side - w) // 2
-    y = (padded_side - h) // 2
-    square_img.paste(image, (x, y))
-
-    return square_img
-
 def process_file(file, idx, quality=90, article_number="", keep_original=False,
                  make_square_images=False, padding_ratio=0.1, bg_color=(0, 0, 0, 0),
-                 output_format="WebP", append_original=False, lossless=False):
-    """Behandler en fil: Trimmer og konverterer til valgt format"""
+                 output_format="WebP", append_original=False, lossless=False, lean=False,
+                 preset="max", target_kb=None):
+    """Behandler en fil: Trimmer og konverterer til valgt format.
+
+    ``lean`` velger stripevis trimming for bilder som er for store for minnebudsjettet.
+    """
+    # HEIF-støtte registreres først når en HEIF/AVIF-fil faktisk dukker opp
+    ensure_heif_for(file.name)
     try:
-        image = Image.open(file)
+        with telemetry.span("bildetomrom.decode", file=file.name) as span:
+            span.add_bytes(inp=getattr(file, "size", 0))
+            image = Image.open(file)
+            image.load()
     except UnidentifiedImageError:
-        return f"unsupported_{file.name}", None
+        telemetry.count("bildetomrom.unsupported", file=file.name)
+        return f"unsupported_{file.name}", None, None
 
-    trimmed_image = trim_transparent(image)
-
-    if make_square_images:
-        trimmed_image = make_square(trimmed_image, padding_ratio, bg_color)
-
-    # Konverter til valgt format
-    buf = io.BytesIO()
-    ext = output_format.lower()
-    save_format = "WEBP" if output_format == "WebP" else "PNG"
-
-    if output_format == "WebP":
-        trimmed_image.save(buf, format=save_format, quality=quality, method=6, lossless=lossless)
+    if lean:
+        with telemetry.span("bildetomrom.trim_strips", file=file.name, pixels=image.width * image.height):
+            trimmed_image = trim_square_strips(image, make_square_images, padding_ratio, bg_color)
     else:
-        trimmed_image.save(buf, format=save_format)
+        with telemetry.span("bildetomrom.trim", file=file.name, pixels=image.width * image.height):
+            trimmed_image = trim_transparent(image)
 
-    buf.seek(0)
+    if make_square_images and not lean:
+        with telemetry.span("bildetomrom.square", file=file.name):
+            trimmed_image = make_square(trimmed_image, padding_ratio, bg_color)
 
-    # Bestem filnavn
-    original_name = file.name.rsplit('.', 1)[0]
-    if keep_original or not article_number.strip():
-        out_name = f"{original_name}.{ext}"
-    else:
-        if append_original:
-            out_name = f"{article_number.strip()}, {original_name}.{ext}"
-        else:
-            out_name = f"{article_number.strip()}, {idx + 1}.{ext}"
+    # Konverter til valgt format
+    with telemetry.span("bildetomrom.encode", file=file.name, format=output_format, preset=preset) as span:
+        result = encoding.encode(trimmed_image, output_format, preset, quality, lossless, target_kb)
+        span.add_bytes(out=result.size)
+        span.set(quality=result.quality, attempts=result.attempts)
+    ext = encoding.extension(result.format)
 
-    return out_name, buf.getvalue()
+    out_name = output_name(file.name, idx, ext, article_number, keep_original, append_original)
+    return out_name, result.data, encoding.describe(result)
 
-@st.cache_data(show_spinner=False)
 def process_images(files, quality, article_number="", keep_original=False,
                    make_square_images=False, padding_ratio=0.1, bg_color=(0, 0, 0, 0),
-                   output_format="WebP", append_original=False, lossless=False):
-    """Prosesserer alle bilder parallelt og cacher resultatet"""
+                   output_format="WebP", append_original=False, lossless=False,
+                   preset="max", target_kb=None, near=False, digests=None, phashes=None):
+    """Prosesserer alle bilder parallelt og legger resultatet i resultatlageret.
+
+    Filer med identisk innhold behandles én gang, og resultatet lagres under
+    filnavnet til hver av dem. Bilder som allerede finnes i lageret med samme
+    innstillinger, behandles ikke på nytt. Med ``near`` regnes også
+    perseptuelle hasher i samme pool og budsjett, og nesten like par returneres.
+
+    ``digests`` (file_id -> SHA-256) og ``phashes`` (SHA-256 -> dHash) er
+    mellomlagre fra økten, så uendrede opplastinger ikke hashes på nytt.
+    Returnerer (bilder, antall duplikater, nesten like par), der hvert bilde
+    er (filnavn, handle, info).
+    """
     files_to_process = files[:300]
-    total = len(files_to_process)
+    groups = dedup.group_exact(files_to_process, digests)
+    phashes = {} if phashes is None else phashes
+    total = len(groups)
+    duplicates = len(files_to_process) - total
+    telemetry.count("bildetomrom.duplicates", duplicates)
     processed_images = []
 
+    results = store.shared_store()
+    # Alt som påvirker innholdet i resultatet; filnavnet lages per opplasting
+    params = {
+        "page": "bildetomrom", "quality": quality, "square": make_square_images,
+        "padding": padding_ratio, "bg": bg_color, "format": output_format,
+        "lossless": lossless, "preset": preset, "target_kb": target_kb,
+    }
+
+    def add(group, handle):
+        ext, info = handle.meta["ext"], handle.meta["info"]
+        for member_no, (idx, file) in enumerate(group.members):
+            name = output_name(file.name, idx, ext, article_number, keep_original, append_original)
+            processed_images.append((name, handle, info if member_no == 0 else f"{info} · duplikat"))
+
     progress_bar = st.progress(0)
     status_text = st.empty()
 
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        futures = {
-            executor.submit(
+    # Bildehodene leses først, slik at hver jobb venter til den får plass i minnebudsjettet
+    budget = admission.shared_budget()
+    square_padding = padding_ratio if make_square_images else None
+
+    with telemetry.span("bildetomrom.batch", process=True, files=total, format=output_format) as batch, \
+            ThreadPoolExecutor(max_workers=8) as executor:
+        futures = {}
+        done = 0
+        for group in groups:
+            key = results.key(group.digest, params)
+            handle = results.get(key)
+            if handle is not None:
+                telemetry.count("bildetomrom.store_hit")
+                add(group, handle)
+                done += 1
+                continue
+            idx, file = group.members[0]
+            ensure_heif_for(file.name)
+            cost, lean = admission.plan(file, square_padding, budget, output_format, preset)
+            future = admission.submit(
+                executor, budget, cost,
                 process_file, file, idx, quality, article_number, keep_original,
-                make_square_images, padding_ratio, bg_color, output_format, append_original, lossless
-            ): file
-            for idx, file in enumerate(files_to_process)
-        }
-
-        for idx, future in enumerate(as_completed(futures), start=1):
-            filename, data = future.result()
+                make_square_images, padding_ratio, bg_color, output_format, append_original, lossless,
+                lean=lean, preset=preset, target_kb=target_kb
+            )
+            futures[future] = group, key
+
+        # Perseptuelle hasher dekoder hele bildet for annet enn JPEG, så de går også via budsjettet
+        hash_futures = {}
+        if near:
+            for group in groups:
+                if group.digest not in phashes:
+                    file = group.representative
+                    hash_futures[group.digest] = admission.submit(
+                        executor, budget, admission.cost(file),
+                        dedup.perceptual_hash, dedup.read_bytes(file), file.name
+                    )
+
+        for idx, future in enumerate(as_completed(futures), start=done + 1):
+            filename, data, info = future.result()
             if data:
-                processed_images.append((filename, data))
+                group, key = futures[future]
+                ext = filename.rsplit('.', 1)[-1]
+                # Samme resultat under navnet til hver duplikat
+                add(group, results.put(key, data, meta={"ext": ext, "info": info}))
+                batch.add_bytes(out=len(data))
 
             progress_bar.progress(idx / total)
             status_text.text(f"Behandler bilde {idx}/{total}...")
 
+        for digest, future in hash_futures.items():
+            phashes[digest] = future.result()
+
     status_text.text("✅ Ferdig!")
     progress_bar.empty()
 
-    return processed_images
+    near_pairs = []
+    if near:
+        near_pairs = dedup.near_pairs([(group.representative.name, phashes.get(group.digest))
+                                       for group in groups])
+    return processed_images, duplicates, near_pairs
 
 if uploaded_files:
-    processed_images = process_images(
-        uploaded_files, webp_quality, article_number, keep_original_names,
+    processed_images, duplicate_count, near = process_images(
+        uploaded_files, image_quality, article_number, keep_original_names,
         make_square_images, padding_ratio,
         output_format=output_format,
-        append_original=append_original_after_article, lossless=webp_lossless
+        append_original=append_original_after_article, lossless=webp_lossless,
+        preset=encode_preset, target_kb=target_kb, near=flag_near_duplicates,
+        digests=st.session_state.setdefault("bildetomrom_digests", {}),
+        phashes=st.session_state.setdefault("bildetomrom_phashes", {})
     )
 
+    if duplicate_count:
+        st.info(f"{duplicate_count} filer var identiske med andre opplastinger og ble bare behandlet én gang.")
+    if near:
+        st.warning("Disse bildene ser nesten like ut. Kontroller om alle skal brukes:\n\n"
+                   + "\n".join(f"- {pair.first} ≈ {pair.second}" for pair in near))
+
+    # Filer kan ha blitt ryddet bort fra lageret; de behandles på nytt ved neste kjøring
+    missing = [filename for filename, handle, _ in processed_images if not handle.exists()]
+    if missing:
+        st.warning(f"{len(missing)} filer er ikke lenger i resultatlageret og er utelatt. "
+                   "Oppdater siden for å behandle dem på nytt.")
+        processed_images = [item for item in processed_images if item[1].exists()]
+
     st.subheader("🔽 Nedlastingsvalg")
 
-    # ZIP download
-    if len(processed_images) > 1:
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, "w") as zip_file:
-            for filename, data in processed_images:
-                zip_file.writestr(filename, data)
-        zip_buffer.seek(0)
+    # Dataene til nedlastingene lages først når brukeren klikker, så ingenting
+    # holdes i minnet mellom kjøringene. ZIP-en bygges på disk i resultatlageret.
+    entries = [(filename, handle) for filename, handle, _ in processed_images]
+    if len(entries) > 1:
+        def zip_data():
+            with telemetry.span("bildetomrom.zip", files=len(entries)) as span:
+                zip_handle = store.build_zip(entries)
+                span.add_bytes(out=zip_handle.size)
+            return zip_handle.read()
 
         st.download_button(
             label=f"Last ned alle som ZIP ({output_format})",
-            data=zip_buffer,
+            data=zip_data,
             file_name=f"{output_format.lower()}.zip",
             mime="application/zip"
         )
 
-    # Individual downloads
-    for filename, data in processed_images:
-        st.download_button(
-            label=f"Last ned {filename}",
-            data=data,
-            file_name=filename,
-            mime=f"image/{output_format.lower()}",
-            key=f"dl_{filename}"
-        )
-
     st.divider()
 
-    # Show previews in 3 columns
+    # Forhåndsvisninger side for side, fra små kopier i resultatlageret
+    page_count = -(-len(processed_images) // PREVIEWS_PER_PAGE)
+    page_no = st.number_input("Side", min_value=1, max_value=page_count, value=1) if page_count > 1 else 1
+    start = (page_no - 1) * PREVIEWS_PER_PAGE
     cols = st.columns(3)
-    for idx, (filename, data) in enumerate(processed_images):
+    for idx, (filename, handle, info) in enumerate(processed_images[start:start + PREVIEWS_PER_PAGE]):
         with cols[idx % 3]:
-            st.image(data, caption=f"Beskåret: {filename}", use_container_width=True)
+            thumb = store.preview(handle)
+            if thumb:
+                st.image(thumb, caption=f"Beskåret: {filename} ({info})", use_container_width=True)
+            else:
+                st.caption(f"Beskåret: {filename} ({info})")
+            st.download_button(
+                label=f"Last ned {filename}",
+                data=handle.read,
+                file_name=filename,
+                mime=f"image/{output_format.lower()}",
+                key=f"dl_{filename}"
+            )
@@ -1,6 +1,11 @@
 import os
 import streamlit as st
-from openai import OpenAI
+
+from core import telemetry
+from core.lazy import lazy_import
+
+# openai er tung å importere og trengs først når brukeren genererer tekst
+openai = lazy_import("openai")
 
 # Load API key from Streamlit secrets (local) or environment variable (Cloud Run)
 api_key = st.secrets.get("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
@@ -9,8 +14,6 @@ if not api_key:
     st.error("❌ OpenAI API key not found. Set it in .streamlit/secrets.toml (local) or as an env var in Cloud Run.")
     st.stop()
 
-client = OpenAI(api_key=api_key)
-
 st.title("🔴 Elotecifisering ved hjelp av OpenAI")
 
 uploaded_file = st.file_uploader("Last opp dokument (Word, PDF, TXT)", type=["docx", "pdf", "txt"])
@@ -21,13 +24,17 @@ if uploaded_file:
     # Here you could extract text, send to OpenAI, and display output
     if st.button("Generer Elotec-tekst"):
         with st.spinner("Behandler nå dokument standard prompt..."):
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a professional translator that rewrites documents into Elotec style, short, technical, and precise."},
-                    {"role": "user", "content": "Here is the document text:\n\n" + uploaded_file.getvalue().decode("utf-8", errors="ignore")}
-                ]
-            )
+            with telemetry.span("elotec.openai", model="gpt-4o-mini") as span:
+                span.add_bytes(inp=uploaded_file.size)
+                client = openai.OpenAI(api_key=api_key)
+                response = client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[
+                        {"role": "system", "content": "You are a professional translator that rewrites documents into Elotec style, short, technical, and precise."},
+                        {"role": "user", "content": "Here is the document text:\n\n" + uploaded_file.getvalue().decode("utf-8", errors="ignore")}
+                    ]
+                )
+                span.add_bytes(out=len((response.choices[0].message.content or "").encode("utf-8")))
 
         ai_text = response.choices[0].message.content
         st.subheader("🔹 Generert Elotec-tekst")
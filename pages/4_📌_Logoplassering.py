@@ -1,25 +1,51 @@
 import streamlit as st
 from PIL import Image, UnidentifiedImageError
-import io, zipfile
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# Registrer HEIF/AVIF-støtte hvis tilgjengelig
-try:
-    import pillow_heif
-    pillow_heif.register_heif_opener()
-except ImportError:
-    pass
+from core import admission, dedup, encoding, store, telemetry
+from core.imaging import overlay_logo
+from core.lazy import ensure_heif_for
 
 st.title("📌 Legg til logo på bilder")
 
+# Antall forhåndsvisninger per side; bare disse lastes inn ved hver kjøring
+PREVIEWS_PER_PAGE = 12
+
 # --- Sidebar ---
 st.sidebar.header("Innstillinger")
 output_format = st.sidebar.radio(
     "Velg eksportformat",
-    ["WebP", "PNG"],
+    ["WebP", "PNG", "AVIF"],
     index=0,
-    help="WebP gir mindre filer, PNG gir maksimal kompatibilitet"
+    help="WebP gir mindre filer, PNG gir maksimal kompatibilitet, AVIF gir minst filer for fotografier"
 )
+if output_format == "AVIF" and not encoding.avif_available():
+    st.sidebar.warning("AVIF-koder mangler på serveren. Bildene lagres som WebP.")
+    output_format = "WebP"
+encode_preset = "fast"
+image_quality = 100
+webp_lossless = False
+target_kb = None
+if output_format in ("WebP", "AVIF"):
+    encode_preset = st.sidebar.radio(
+        "Kodingsmodus",
+        encoding.PRESETS,
+        format_func=encoding.PRESET_LABELS.get,
+        index=1,
+        help="Maks kvalitet bruker mest tid på komprimering. Rask er mange ganger raskere med litt større filer. Målstørrelse finner høyeste kvalitet under valgt filstørrelse."
+    )
+    if encode_preset == "target":
+        target_kb = st.sidebar.number_input(
+            "Maks filstørrelse (KB)",
+            min_value=10, max_value=10000, value=200, step=10
+        )
+    image_quality = st.sidebar.slider(
+        f"Velg {output_format}-kvalitet" if encode_preset != "target" else f"Høyeste {output_format}-kvalitet",
+        min_value=0, max_value=100, value=100 if output_format == "WebP" else 70, step=1,
+        help="Lavere verdi gir mindre filer, men lavere bildekvalitet"
+    )
+    if output_format == "WebP" and encode_preset != "target":
+        webp_lossless = st.sidebar.checkbox("Lossless komprimering", value=False)
 logo_size_ratio = st.sidebar.slider(
     "Logo-størrelse (prosent av bildebredden)",
     min_value=0, max_value=50, value=15, step=1
@@ -50,56 +76,36 @@ uploaded_images = st.file_uploader(
     accept_multiple_files=True
 )
 
-def overlay_logo(image: Image.Image, logo: Image.Image, size_ratio=0.15, opacity=1.0, position="Nedre høyre", padding=20):
-    """Legger logo på bildet i ønsket posisjon med valgfri gjennomsiktighet."""
-    img = image.convert("RGBA")
-    logo = logo.convert("RGBA")
-
-    # Skaler logo
-    logo_width = int(img.width * size_ratio)
-    aspect_ratio = logo.width / logo.height
-    logo_height = int(logo_width / aspect_ratio)
-    logo_resized = logo.resize((logo_width, logo_height), Image.Resampling.LANCZOS)
-
-    # Juster opacity
-    if opacity < 1.0:
-        alpha = logo_resized.getchannel("A")
-        alpha = alpha.point(lambda p: int(p * opacity))
-        logo_resized.putalpha(alpha)
-
-    # Beregn posisjon
-    if position == "Øvre venstre":
-        xy = (padding, padding)
-    elif position == "Øvre høyre":
-        xy = (img.width - logo_resized.width - padding, padding)
-    elif position == "Nedre venstre":
-        xy = (padding, img.height - logo_resized.height - padding)
-    elif position == "Senter":
-        xy = ((img.width - logo_resized.width)//2, (img.height - logo_resized.height)//2)
-    else:  # Nedre høyre
-        xy = (img.width - logo_resized.width - padding, img.height - logo_resized.height - padding)
-
-    img.paste(logo_resized, xy, logo_resized)
-    return img
-
-def process_image(file, logo, size_ratio, opacity, position, padding, output_format):
-    """Behandler ett bilde med logo."""
+def process_image(file, logo, size_ratio, opacity, position, padding, output_format,
+                  preset="fast", quality=100, lossless=False, target_kb=None, lean=False):
+    """Behandler ett bilde med logo.
+
+    ``lean`` legger logoen rett i bildet uten RGBA-kopi, for bilder som er for
+    store for minnebudsjettet.
+    """
+    # HEIF-støtte registreres først når en HEIF/AVIF-fil faktisk dukker opp
+    ensure_heif_for(file.name)
     try:
-        image = Image.open(file)
+        with telemetry.span("logo.decode", file=file.name) as span:
+            span.add_bytes(inp=getattr(file, "size", 0))
+            image = Image.open(file)
+            image.load()
     except UnidentifiedImageError:
+        telemetry.count("logo.unsupported", file=file.name)
         return None
 
-    result_img = overlay_logo(image, logo, size_ratio, opacity, position, padding)
+    with telemetry.span("logo.overlay", file=file.name, pixels=image.width * image.height, lean=lean):
+        result_img = overlay_logo(image, logo, size_ratio, opacity, position, padding, in_place=lean)
 
-    buf = io.BytesIO()
-    save_format = "WEBP" if output_format == "WebP" else "PNG"
-    result_img.save(buf, format=save_format)  # alltid 100% kvalitet
-    buf.seek(0)
+    with telemetry.span("logo.encode", file=file.name, format=output_format, preset=preset) as span:
+        result = encoding.encode(result_img, output_format, preset, quality, lossless, target_kb)
+        span.add_bytes(out=result.size)
+        span.set(quality=result.quality, attempts=result.attempts)
 
     # Behold originalt navn
     base_name = file.name.rsplit('.', 1)[0]
-    ext = output_format.lower()
-    return f"{base_name}_logo.{ext}", buf.getvalue()
+    ext = encoding.extension(result.format)
+    return f"{base_name}_logo.{ext}", result.data, encoding.describe(result)
 
 # --- Prosessering ---
 if uploaded_logo and uploaded_images:
@@ -107,51 +113,107 @@ if uploaded_logo and uploaded_images:
     st.write(f"Logo lastet opp: {uploaded_logo.name}")
 
     def process_all(files):
+        """Returnerer (bilder, antall duplikater), der hvert bilde er (filnavn, handle, info)."""
         results = []
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            futures = [
-                executor.submit(
+        # Like filer behandles én gang og fordeles på alle filnavnene
+        groups = dedup.group_exact(files, st.session_state.setdefault("logo_digests", {}))
+        telemetry.count("logo.duplicates", len(files) - len(groups))
+        # Ferdige bilder hentes fra resultatlageret når logo og innstillinger er de samme
+        result_store = store.shared_store()
+        params = {
+            "page": "logo", "logo": dedup.content_hash(dedup.read_bytes(uploaded_logo)),
+            "size": logo_size_ratio, "opacity": logo_opacity, "position": position,
+            "padding": padding, "format": output_format, "preset": encode_preset,
+            "quality": image_quality, "lossless": webp_lossless, "target_kb": target_kb,
+        }
+
+        def add(group, handle):
+            ext, info = handle.meta["ext"], handle.meta["info"]
+            for member_no, (_, file) in enumerate(group.members):
+                base_name = file.name.rsplit('.', 1)[0]
+                results.append((f"{base_name}_logo.{ext}", handle,
+                                info if member_no == 0 else f"{info} · duplikat"))
+
+        # Hver jobb venter til bildet får plass i minnebudsjettet
+        budget = admission.shared_budget()
+        with telemetry.span("logo.batch", process=True, files=len(groups), format=output_format) as batch, \
+                ThreadPoolExecutor(max_workers=8) as executor:
+            futures = {}
+            for group in groups:
+                key = result_store.key(group.digest, params)
+                handle = result_store.get(key)
+                if handle is not None:
+                    telemetry.count("logo.store_hit")
+                    add(group, handle)
+                    continue
+                file = group.representative
+                ensure_heif_for(file.name)
+                cost, lean = admission.plan(file, None, budget, output_format, encode_preset)
+                future = admission.submit(
+                    executor, budget, cost,
                     process_image,
                     file, logo_img, logo_size_ratio/100, logo_opacity/100,
-                    position, padding, output_format
+                    position, padding, output_format,
+                    encode_preset, image_quality, webp_lossless, target_kb, lean=lean
                 )
-                for file in files
-            ]
+                futures[future] = group, key
             for future in as_completed(futures):
                 result = future.result()
                 if result:
-                    results.append(result)
-        return results
-
-    processed = process_all(uploaded_images)
+                    filename, data, info = result
+                    group, key = futures[future]
+                    ext = filename.rsplit('.', 1)[-1]
+                    add(group, result_store.put(key, data, meta={"ext": ext, "info": info}))
+                    batch.add_bytes(out=len(data))
+        return results, len(files) - len(groups)
+
+    processed, duplicate_count = process_all(uploaded_images)
+    if duplicate_count:
+        st.info(f"{duplicate_count} filer var identiske med andre opplastinger og ble bare behandlet én gang.")
+
+    # Filer kan ha blitt ryddet bort fra lageret; de behandles på nytt ved neste kjøring
+    missing = [filename for filename, handle, _ in processed if not handle.exists()]
+    if missing:
+        st.warning(f"{len(missing)} filer er ikke lenger i resultatlageret og er utelatt. "
+                   "Oppdater siden for å behandle dem på nytt.")
+        processed = [item for item in processed if item[1].exists()]
 
     st.subheader("🔽 Nedlastingsvalg")
-    if len(processed) > 1:
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, "w") as zip_file:
-            for filename, data in processed:
-                zip_file.writestr(filename, data)
-        zip_buffer.seek(0)
+    # Dataene til nedlastingene lages først når brukeren klikker, så ingenting
+    # holdes i minnet mellom kjøringene. ZIP-en bygges på disk i resultatlageret.
+    entries = [(filename, handle) for filename, handle, _ in processed]
+    if len(entries) > 1:
+        def zip_data():
+            with telemetry.span("logo.zip", files=len(entries)) as span:
+                zip_handle = store.build_zip(entries)
+                span.add_bytes(out=zip_handle.size)
+            return zip_handle.read()
+
         st.download_button(
             "Last ned alle som ZIP",
-            data=zip_buffer,
+            data=zip_data,
             file_name=f"logoed_images.{output_format.lower()}.zip",
             mime="application/zip"
         )
 
-    for filename, data in processed:
-        st.download_button(
-            label=f"Last ned {filename}",
-            data=data,
-            file_name=filename,
-            mime=f"image/{output_format.lower()}",
-            key=f"dl_{filename}"
-        )
-
     st.divider()
 
-    # Vis forhåndsvisning
+    # Vis forhåndsvisning side for side, fra små kopier i resultatlageret
+    page_count = -(-len(processed) // PREVIEWS_PER_PAGE)
+    page_no = st.number_input("Side", min_value=1, max_value=page_count, value=1) if page_count > 1 else 1
+    start = (page_no - 1) * PREVIEWS_PER_PAGE
     cols = st.columns(3)
-    for idx, (filename, data) in enumerate(processed):
+    for idx, (filename, handle, info) in enumerate(processed[start:start + PREVIEWS_PER_PAGE]):
         with cols[idx % 3]:
-            st.image(data, caption=filename, use_container_width=True)
\ No newline at end of file
+            thumb = store.preview(handle)
+            if thumb:
+                st.image(thumb, caption=f"{filename} ({info})", use_container_width=True)
+            else:
+                st.caption(f"{filename} ({info})")
+            st.download_button(
+                label=f"Last ned {filename}",
+                data=handle.read,
+                file_name=filename,
+                mime=f"image/{output_format.lower()}",
+                key=f"dl_{filename}"
+            )
@@ -1,17 +1,12 @@
 import streamlit as st
-from io import BytesIO
-from datetime import date
 
-try:
-    from pypdf import PdfReader, PdfWriter
-except Exception as e:  # pragma: no cover - handled at runtime
-    PdfReader = None
-    PdfWriter = None
+from core import telemetry
+from core.lazy import is_available
+from core.pdf import optimize_pdf
 
-try:
-    from reportlab.pdfgen import canvas
-except Exception:  # pragma: no cover - handled at runtime
-    canvas = None
+# pypdf og reportlab importeres først når en PDF faktisk skal behandles
+HAS_PYPDF = is_available("pypdf")
+HAS_REPORTLAB = is_available("reportlab")
 
 st.set_page_config(page_title="PDF-optimalisering og vannmerking", page_icon=":page_facing_up:")
 
@@ -23,56 +18,24 @@ add_watermark = st.checkbox("Legg til vannmerking")
 compress_pdf = st.checkbox("Komprimer PDF", value=True)
 
 if uploaded_file is not None:
-    if PdfReader is None or PdfWriter is None:
+    if not HAS_PYPDF:
         st.error("Modulen 'pypdf' er ikke tilgjengelig. Kan ikke behandle PDF.")
-    elif add_watermark and canvas is None:
+    elif add_watermark and not HAS_REPORTLAB:
         st.error("Modulen 'reportlab' er ikke tilgjengelig. Kan ikke vannmerke PDF.")
     elif add_watermark and not article_number:
         st.error("Skriv inn artikkelnr for vannmerking.")
     elif not add_watermark and not compress_pdf:
         st.error("Velg komprimering og/eller vannmerking.")
     else:
-        reader = PdfReader(uploaded_file)
-        writer = PdfWriter()
-        today = date.today().isoformat()
-        for page in reader.pages:
-            page_width = float(page.mediabox.width)
-            page_height = float(page.mediabox.height)
-            if add_watermark:
-                line1 = "Elotec AS - kun for intern bruk."
-                line2 = f"Artikkelnr {article_number} {today}"
-                packet = BytesIO()
-                can = canvas.Canvas(packet, pagesize=(page_width, page_height))
-                can.saveState()
-                can.translate(page_width / 2, page_height / 2)
-                can.rotate(45)
-
-                can.setFont("Helvetica", 40)
-
-                try:
-                    can.setFillAlpha(0.3)
-                except Exception:
-                    pass
-                  
-                can.drawCentredString(0, 20, line1)
-                can.drawCentredString(0, -20, line2)
-
-                can.restoreState()
-                can.save()
-                packet.seek(0)
-                watermark_pdf = PdfReader(packet)
-                watermark_page = watermark_pdf.pages[0]
-                page.merge_page(watermark_page)
-            if compress_pdf:
-                try:
-                    page.compress_content_streams()
-                except Exception:
-                    pass
-            writer.add_page(page)
-        writer.add_metadata(reader.metadata or {})
-        output = BytesIO()
-        writer.write(output)
-        output.seek(0)
+        with telemetry.span("pdf.optimize", file=uploaded_file.name) as span:
+            span.add_bytes(inp=uploaded_file.size)
+            output = optimize_pdf(
+                uploaded_file,
+                article_number=article_number,
+                add_watermark=add_watermark,
+                compress=compress_pdf,
+            )
+            span.add_bytes(out=output.getbuffer().nbytes)
         success_msg = []
         if compress_pdf:
             success_msg.append("komprimert")
@@ -1,20 +1,31 @@
 import streamlit as st
 from PIL import Image, UnidentifiedImageError
-import io
-import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from core import admission, dedup, encoding, store, telemetry
+from core.imaging import make_thumbnail
 
 st.set_page_config(layout="wide")
 
 st.title("📷 Bildekonvertering til 250x250")
+
+# Antall forhåndsvisninger per side; bare disse lastes inn ved hver kjøring
+PREVIEWS_PER_PAGE = 16
 st.sidebar.header("Innstillinger")
 
 # 1. Output format selection
 output_format = st.sidebar.radio(
     "Velg eksportformat",
-    ["PNG", "WebP", "JPG"],
+    ["PNG", "WebP", "JPG", "AVIF"],
     index=0, # Default to PNG
     help="Velg formatet bildene skal lagres i."
 )
+if output_format == "AVIF" and not encoding.avif_available():
+    st.sidebar.warning("AVIF-koder mangler på serveren. Bildene lagres som WebP.")
+    output_format = "WebP"
+
+# Kvalitet per format; 250x250 er så lite at maks innsats koster lite
+FORMAT_QUALITY = {"JPG": 95, "WebP": 90, "AVIF": 70, "PNG": None}
 
 # 2. File uploader
 uploaded_files = st.file_uploader(
@@ -24,92 +35,126 @@ uploaded_files = st.file_uploader(
 )
 
 def process_image(uploaded_file, output_format):
-    """Resizes and converts a single image, preserving aspect ratio with white bars."""
+    """Resizes and converts a single image, preserving aspect ratio with white bars.
+
+    Returns (filename, data, error). Runs in a worker thread, so errors are
+    returned instead of shown here.
+    """
     try:
-        image = Image.open(uploaded_file)
-        
-        # Use a consistent working mode, converting at the end if necessary.
-        # RGBA is safer to work with to preserve transparency.
-        image = image.convert('RGBA')
-
-        # Create a thumbnail (preserves aspect ratio)
-        thumb = image.copy()
-        thumb.thumbnail((250, 250), Image.Resampling.LANCZOS)
-
-        # Create a new image with a light gray background.
-        # The background should be RGBA to allow pasting a transparent thumb on it.
-        background = Image.new('RGBA', (250, 250), (248, 250, 252, 255))
-
-        # Paste the thumbnail onto the center of the background
-        paste_position = (
-            (250 - thumb.width) // 2,
-            (250 - thumb.height) // 2
-        )
-        background.paste(thumb, paste_position, thumb)
+        with telemetry.span("thumbnail.decode", file=uploaded_file.name) as span:
+            span.add_bytes(inp=getattr(uploaded_file, "size", 0))
+            image = Image.open(uploaded_file)
+            image.load()
+
+        with telemetry.span("thumbnail.resize", file=uploaded_file.name, pixels=image.width * image.height):
+            background = make_thumbnail(image)
 
         # --- Saving logic ---
-        buf = io.BytesIO()
-        ext = output_format.lower()
-        save_format = "JPEG" if ext == "jpg" else ext.upper()
-
-        final_image = background
-        if save_format == "JPEG":
-            # JPEG doesn't support alpha, so convert to RGB.
-            final_image = background.convert('RGB')
-            final_image.save(buf, format=save_format, quality=95)
-        elif save_format == "WEBP":
-            final_image.save(buf, format=save_format, quality=90, lossless=False)
-        else: # PNG
-            final_image.save(buf, format=save_format)
-
-        buf.seek(0)
+        # JPEG doesn't support alpha; encode() converts to RGB.
+        with telemetry.span("thumbnail.encode", file=uploaded_file.name, format=output_format) as span:
+            result = encoding.encode(background, output_format, "max", FORMAT_QUALITY[output_format])
+            span.add_bytes(out=result.size)
 
         # Generate filename
         original_name = uploaded_file.name.rsplit('.', 1)[0]
-        new_filename = f"{original_name}_250x250.{ext}"
+        new_filename = f"{original_name}_250x250.{encoding.extension(result.format)}"
 
-        return new_filename, buf.getvalue()
+        return new_filename, result.data, None
 
     except (UnidentifiedImageError, Exception) as e:
-        st.warning(f"Kunne ikke behandle {uploaded_file.name}. Feil: {e}")
-        return None, None
+        return None, None, f"Kunne ikke behandle {uploaded_file.name}. Feil: {e}"
+
+
+def cached_process(group, output_format):
+    """Henter bildet fra resultatlageret, eller behandler og lagrer det.
+
+    Returns (handle, error).
+    """
+    result_store = store.shared_store()
+    key = result_store.key(group.digest, {"page": "thumbnail", "format": output_format,
+                                          "quality": FORMAT_QUALITY[output_format]})
+    handle = result_store.get(key)
+    if handle is not None:
+        telemetry.count("thumbnail.store_hit")
+        return handle, None
+    filename, data, error = process_image(group.representative, output_format)
+    if error or not data:
+        return None, error
+    return result_store.put(key, data, meta={"ext": filename.rsplit('_250x250.', 1)[-1]}), None
 
 
 if uploaded_files:
     st.subheader("Behandlede bilder")
     processed_images = []
-    for file in uploaded_files:
-        filename, data = process_image(file, output_format)
-        if filename and data:
-            processed_images.append((filename, data))
+    # Like filer behandles én gang og fordeles på alle filnavnene
+    groups = dedup.group_exact(uploaded_files, st.session_state.setdefault("thumbnail_digests", {}))
+    duplicate_count = len(uploaded_files) - len(groups)
+    telemetry.count("thumbnail.duplicates", duplicate_count)
+    with telemetry.span("thumbnail.batch", process=True, files=len(groups), format=output_format) as batch, \
+            ThreadPoolExecutor(max_workers=8) as executor:
+        # Hver jobb venter til bildet får plass i minnebudsjettet, som på side 2 og 4.
+        # Kodingen skjer på 250x250, så utformatet er ikke med i anslaget.
+        budget = admission.shared_budget()
+        futures = [
+            admission.submit(executor, budget, admission.cost(group.representative),
+                             cached_process, group, output_format)
+            for group in groups
+        ]
+        for group, future in zip(groups, futures):
+            handle, error = future.result()
+            if error:
+                st.warning(error)
+            elif handle:
+                batch.add_bytes(out=handle.size)
+                # Samme resultat under navnet til hver duplikat
+                for _, file in group.members:
+                    base_name = file.name.rsplit('.', 1)[0]
+                    processed_images.append((f"{base_name}_250x250.{handle.meta['ext']}", handle))
+    if duplicate_count:
+        st.info(f"{duplicate_count} filer var identiske med andre opplastinger og ble bare behandlet én gang.")
+
+    # Filer kan ha blitt ryddet bort fra lageret; de behandles på nytt ved neste kjøring
+    missing = [filename for filename, handle in processed_images if not handle.exists()]
+    if missing:
+        st.warning(f"{len(missing)} filer er ikke lenger i resultatlageret og er utelatt. "
+                   "Oppdater siden for å behandle dem på nytt.")
+        processed_images = [item for item in processed_images if item[1].exists()]
 
     if processed_images:
-        # Display download buttons and previews
+        # Display previews and download buttons, one page at a time. The data
+        # for each download is read from the store only when it is clicked.
+        page_count = -(-len(processed_images) // PREVIEWS_PER_PAGE)
+        page_no = st.number_input("Side", min_value=1, max_value=page_count, value=1) if page_count > 1 else 1
+        start = (page_no - 1) * PREVIEWS_PER_PAGE
         cols = st.columns(4)
-        for idx, (filename, data) in enumerate(processed_images):
+        for idx, (filename, handle) in enumerate(processed_images[start:start + PREVIEWS_PER_PAGE]):
             with cols[idx % 4]:
-                st.image(data, caption=filename, use_container_width=True)
+                thumb = store.preview(handle)
+                if thumb:
+                    st.image(thumb, caption=filename, use_container_width=True)
+                else:
+                    st.caption(filename)
                 st.download_button(
                     label=f"Last ned {filename}",
-                    data=data,
+                    data=handle.read,
                     file_name=filename,
                     mime=f"image/{output_format.lower()}",
                     key=f"dl_{filename}"
                 )
 
-        # ZIP download for multiple files
+        # ZIP download for multiple files, built on disk when clicked
         if len(processed_images) > 1:
-            zip_buffer = io.BytesIO()
-            with zipfile.ZipFile(zip_buffer, "w") as zip_file:
-                for filename, data in processed_images:
-                    zip_file.writestr(filename, data)
-            zip_buffer.seek(0)
+            def zip_data():
+                with telemetry.span("thumbnail.zip", files=len(processed_images)) as span:
+                    zip_handle = store.build_zip(processed_images)
+                    span.add_bytes(out=zip_handle.size)
+                return zip_handle.read()
 
             st.sidebar.divider()
             st.sidebar.download_button(
                 label=f"Last ned alle som ZIP",
-                data=zip_buffer,
+                data=zip_data,
                 file_name=f"bilder_250x250_{output_format.lower()}.zip",
                 mime="application/zip",
                 use_container_width=True
-            )
\ No newline at end of file
+            )
@@ -1,12 +1,17 @@
 
 import streamlit as st
-import requests
-from bs4 import BeautifulSoup
 import os
 from urllib.parse import urljoin, urlparse
 import zipfile
 import io
 
+from core import dedup, telemetry
+from core.lazy import lazy_import
+
+# requests og bs4 lastes først når brukeren starter en nedlasting
+requests = lazy_import("requests")
+bs4 = lazy_import("bs4")
+
 def get_best_image_from_srcset(srcset, base_url):
     """Parses srcset and returns the URL of the highest resolution image."""
     best_url = ""
@@ -56,7 +61,8 @@ if st.button("Start nedlasting", key="start_download_button"):
             chrome_options.add_argument("--disable-dev-shm-usage")
             chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36")
 
-            with st.spinner("Starter en virtuell nettleser for å laste siden... (dette kan ta et øyeblikk)"):
+            with st.spinner("Starter en virtuell nettleser for å laste siden... (dette kan ta et øyeblikk)"), \
+                    telemetry.span("url.selenium_load", url=url) as span:
                 # Use webdriver-manager to automatically download and manage the chromedriver
                 service = ChromeService(ChromeDriverManager().install())
                 driver = webdriver.Chrome(service=service, options=chrome_options)
@@ -69,9 +75,12 @@ if st.button("Start nedlasting", key="start_download_button"):
                 
                 html_content = driver.page_source
                 driver.quit()
+                span.add_bytes(out=len(html_content))
 
-            soup = BeautifulSoup(html_content, 'html.parser')
-            img_tags = soup.find_all('img')
+            with telemetry.span("url.parse", url=url) as span:
+                soup = bs4.BeautifulSoup(html_content, 'html.parser')
+                img_tags = soup.find_all('img')
+                span.set(img_tags=len(img_tags))
 
             if not img_tags:
                 st.warning("Fant ingen bilder (<img>-tags) på denne siden, selv etter å ha brukt en virtuell nettleser.")
@@ -106,13 +115,25 @@ if st.button("Start nedlasting", key="start_download_button"):
             st.success(f"Klar til å laste ned {len(image_urls)} unike bilder.")
 
             zip_buffer = io.BytesIO()
+            # Samme bilde ligger ofte på siden under flere URL-er; pakk hvert bilde bare én gang
+            seen_hashes = set()
+            duplicate_count = 0
             with zipfile.ZipFile(zip_buffer, "a", zipfile.ZIP_DEFLATED, False) as zip_file:
                 progress_bar = st.progress(0)
                 for i, image_url in enumerate(image_urls):
                     try:
                         # Use requests to download the actual image file, as Selenium is not needed for this part
-                        img_response = requests.get(image_url, stream=True, timeout=15)
-                        img_response.raise_for_status()
+                        with telemetry.span("url.download", url=image_url) as span:
+                            img_response = requests.get(image_url, stream=True, timeout=15)
+                            img_response.raise_for_status()
+                            span.add_bytes(out=len(img_response.content))
+
+                        digest = dedup.content_hash(img_response.content)
+                        if digest in seen_hashes:
+                            duplicate_count += 1
+                            progress_bar.progress((i + 1) / len(image_urls), text=f"Hopper over duplikat {image_url}")
+                            continue
+                        seen_hashes.add(digest)
                         
                         # Get a clean filename from the URL
                         parsed_path = urlparse(image_url).path
@@ -130,9 +151,13 @@ if st.button("Start nedlasting", key="start_download_button"):
                         progress_bar.progress((i + 1) / len(image_urls), text=f"Laster ned {filename}...")
                     
                     except requests.exceptions.RequestException as e:
+                        telemetry.count("url.download_failed", url=image_url)
                         st.error(f"Kunne ikke laste ned {image_url}: {e}")
 
             progress_bar.empty()
+            telemetry.count("url.duplicates", duplicate_count)
+            if duplicate_count:
+                st.info(f"{duplicate_count} bilder var identiske med andre på siden og ble bare pakket én gang.")
             st.success("Alle bilder er pakket i en ZIP-fil!")
 
             domain_name = urlparse(url).netloc.replace('.', '_')
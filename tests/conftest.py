@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Gjør ``core`` og ``bench`` importerbare også når pytest kjøres uten ``python -m``
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
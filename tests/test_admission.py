@@ -0,0 +1,107 @@
+import io
+import threading
+import time
+
+from PIL import Image
+
+from core import admission
+
+
+def _png(mode, size=(300, 300), **params):
+    buf = io.BytesIO()
+    Image.new(mode, size).save(buf, "PNG", **params)
+    buf.seek(0)
+    return buf
+
+
+def _start(budget, cost, order, name):
+    def run():
+        budget.acquire(cost)
+        order.append(name)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def test_budget_admits_in_fifo_order():
+    budget = admission.PixelBudget(100)
+    budget.acquire(80)
+    order = []
+    big = _start(budget, 50, order, "big")
+    _wait_for(lambda: len(budget._queue) == 1)
+    # Liten jobb som ville fått plass, må likevel vente på den store foran seg
+    small = _start(budget, 10, order, "small")
+    _wait_for(lambda: len(budget._queue) == 2)
+    assert order == []
+
+    budget.release(80)
+    big.join(1)
+    small.join(1)
+    assert order == ["big", "small"]
+    assert budget.in_flight == 60
+
+
+def test_oversized_job_runs_alone():
+    budget = admission.PixelBudget(100)
+    budget.acquire(10)
+    order = []
+    huge = _start(budget, 500, order, "huge")
+    _wait_for(lambda: len(budget._queue) == 1)
+    assert order == []
+
+    budget.release(10)
+    huge.join(1)
+    assert order == ["huge"]
+    assert budget.in_flight == 500
+
+    other = _start(budget, 1, order, "other")
+    _wait_for(lambda: len(budget._queue) == 1)
+    assert order == ["huge"]
+    budget.release(500)
+    other.join(1)
+    assert order == ["huge", "other"]
+
+
+def test_reserve_releases_on_error():
+    budget = admission.PixelBudget(100)
+    try:
+        with budget.reserve(40):
+            assert budget.in_flight == 40
+            raise ValueError
+    except ValueError:
+        pass
+    assert budget.in_flight == 0
+
+
+def test_plan_uses_lean_path_only_when_supported():
+    budget = admission.PixelBudget(1000)
+    cost, lean = admission.plan(_png("RGBA"), 0.1, budget)
+    assert lean and cost < admission.estimate_bytes(300, 300, "RGBA", 0.1)
+
+    for file in (_png("P"), _png("L"), _png("RGB", transparency=(0, 0, 0))):
+        cost, lean = admission.plan(file, 0.1, budget)
+        assert not lean
+        assert cost > budget.limit
+
+
+def test_plan_fits_without_lean():
+    budget = admission.PixelBudget(1 << 30)
+    cost, lean = admission.plan(_png("RGB"), None, budget)
+    assert not lean and cost == admission.estimate_bytes(300, 300, "RGB")
+
+
+def test_encoder_term_depends_on_format():
+    webp = admission.estimate_bytes(1000, 1000, "RGB", None, "WebP", "max")
+    fast = admission.estimate_bytes(1000, 1000, "RGB", None, "WebP", "fast")
+    avif = admission.estimate_bytes(1000, 1000, "RGB", None, "AVIF", "fast")
+    assert fast < webp < avif
+
+
+def test_unreadable_file_costs_nothing():
+    assert admission.plan(io.BytesIO(b"not an image"), None, admission.PixelBudget(1)) == (0, False)
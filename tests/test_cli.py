@@ -0,0 +1,75 @@
+import json
+
+from PIL import Image
+
+from core import cli
+
+
+def _image(path, color="red", mode="RGB"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new(mode, (40, 30), color).save(path)
+    return path
+
+
+def _thumb(*args):
+    return cli.main(["thumb", *map(str, args), "-j", "1", "-q"])
+
+
+def test_rerun_skips_processed_files(tmp_path, capsys):
+    _image(tmp_path / "in" / "a.png")
+    _image(tmp_path / "in" / "b.png", "blue")
+    out = tmp_path / "out"
+
+    assert _thumb(tmp_path / "in", "-o", out) == 0
+    assert "2 behandlet, 0 hoppet over" in capsys.readouterr().err
+    manifest = json.loads((out / cli.MANIFEST_NAME).read_text())
+    assert sorted(manifest) == ["a_250x250.png", "b_250x250.png"]
+
+    assert _thumb(tmp_path / "in", "-o", out) == 0
+    assert "0 behandlet, 2 hoppet over" in capsys.readouterr().err
+
+    # Endret innhold gir ny jobbnøkkel og behandles på nytt
+    _image(tmp_path / "in" / "a.png", "green")
+    assert _thumb(tmp_path / "in", "-o", out) == 0
+    assert "1 behandlet, 1 hoppet over" in capsys.readouterr().err
+
+
+def test_identical_inputs_are_processed_once(tmp_path, capsys):
+    _image(tmp_path / "in" / "a.png")
+    _image(tmp_path / "in" / "copy.png")
+    out = tmp_path / "out"
+    assert cli.main(["thumb", str(tmp_path / "in"), "-o", str(out), "-j", "1"]) == 0
+    captured = capsys.readouterr()
+    assert "(+1 duplikater)" in captured.out
+    assert (out / "a_250x250.png").read_bytes() == (out / "copy_250x250.png").read_bytes()
+
+
+def test_name_collisions_are_refused(tmp_path, capsys):
+    _image(tmp_path / "in" / "a" / "x.png")
+    _image(tmp_path / "in" / "b" / "x.png", "blue")
+    _image(tmp_path / "in" / "y.png")
+    _image(tmp_path / "in" / "y.jpg", "blue")
+    out = tmp_path / "out"
+
+    assert _thumb(tmp_path / "in", "-r", "-o", out) == 2
+    err = capsys.readouterr().err
+    assert "2 utfilnavn brukes av flere innfiler" in err
+    assert "x_250x250.png" in err and "y_250x250.png" in err
+    assert not out.exists() or not any(out.glob("*.png"))
+
+
+def test_output_dir_inside_inputs_is_ignored(tmp_path, capsys):
+    _image(tmp_path / "in" / "x.png", mode="RGBA")
+    out = tmp_path / "in" / "out"
+    for _ in range(2):
+        assert cli.main(["trim", str(tmp_path / "in"), "-r", "-o", str(out), "-j", "1", "-q"]) == 0
+    assert "0 behandlet, 1 hoppet over" in capsys.readouterr().err.splitlines()[-1]
+
+
+def test_output_dir_equal_to_inputs_does_not_overwrite(tmp_path):
+    source = _image(tmp_path / "in" / "x.png", mode="RGBA")
+    before = source.read_bytes()
+    code = cli.main(["trim", str(tmp_path / "in"), "-o", str(tmp_path / "in"),
+                     "--keep-names", "--format", "png", "-j", "1", "-q"])
+    assert code != 0
+    assert source.read_bytes() == before
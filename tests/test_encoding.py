@@ -0,0 +1,42 @@
+from PIL import Image
+
+from core import encoding
+
+
+def _noise(size=(200, 200)):
+    return Image.effect_noise(size, 80).convert("RGB")
+
+
+def test_search_target_below_min_quality():
+    calls = []
+
+    def save(q):
+        calls.append(q)
+        return b"x" * 100
+
+    data, quality, attempts, met = encoding._search_target(save, 1000, 3)
+    assert calls and calls[0] == 3
+    assert data == b"x" * 100 and quality == 3 and attempts >= 1 and met
+
+
+def test_search_target_never_met_returns_smallest():
+    def save(q):
+        return b"x" * (1000 + q)
+
+    data, quality, attempts, met = encoding._search_target(save, 10, 80)
+    assert met is False
+    assert quality == encoding.TARGET_MIN_QUALITY
+    assert len(data) == 1000 + encoding.TARGET_MIN_QUALITY
+
+
+def test_encode_target_with_quality_zero():
+    result = encoding.encode(_noise(), "WebP", "target", quality=0, target_kb=1)
+    assert result.format == "WEBP"
+    assert result.quality == 0
+    assert result.data
+
+
+def test_encode_target_unreachable():
+    result = encoding.encode(_noise(), "WebP", "target", quality=90, target_kb=0.01)
+    assert result.met_target is False
+    assert "over mål" in encoding.describe(result)
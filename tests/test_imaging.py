@@ -0,0 +1,41 @@
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+
+from core.imaging import STRIP_HEIGHT, make_square, overlay_logo, trim_square_strips, trim_transparent
+
+
+def _sample(mode, size=(700, 1300)):
+    image = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((60, 90, 610, 1180), fill=(200, 40, 90, 255))
+    draw.ellipse((150, 300, 500, 700), fill=(20, 180, 60, 128))
+    return image.convert(mode)
+
+
+def _same(a, b):
+    return a.size == b.size and ImageChops.difference(a.convert("RGBA"), b.convert("RGBA")).getbbox() is None
+
+
+@pytest.mark.parametrize("mode", ["RGBA", "RGB", "LA", "L", "P"])
+@pytest.mark.parametrize("square", [True, False])
+def test_trim_square_strips_matches_normal_path(mode, square):
+    image = _sample(mode)
+    expected = trim_transparent(image)
+    if square:
+        expected = make_square(expected, 0.1)
+    # Liten stripehøyde gir mange striper og tester skjøtene
+    assert _same(trim_square_strips(image, square, 0.1, strip_height=97), expected)
+
+
+def test_trim_square_strips_default_strip_height():
+    image = _sample("RGBA", size=(300, STRIP_HEIGHT * 2 + 17))
+    assert _same(trim_square_strips(image), make_square(trim_transparent(image), 0.1))
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L"])
+def test_overlay_logo_in_place_matches(mode):
+    logo = Image.new("RGBA", (100, 50), (255, 0, 0, 128))
+    image = _sample(mode)
+    expected = overlay_logo(image, logo, 0.2, 0.7)
+    result = overlay_logo(image.copy(), logo, 0.2, 0.7, in_place=True)
+    assert ImageChops.difference(expected.convert("RGB"), result.convert("RGB")).getbbox() is None
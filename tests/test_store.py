@@ -0,0 +1,79 @@
+import os
+import pickle
+import time
+import zipfile
+
+from core import store
+from core.store import ResultStore
+
+
+def _age(handle, seconds):
+    """Setter sist brukt ``seconds`` tilbake i tid."""
+    past = time.time() - seconds
+    os.utime(handle.path, (past, past))
+
+
+def test_put_get_roundtrip(tmp_path):
+    results = ResultStore(tmp_path)
+    key = results.key("abc", {"quality": 90})
+    handle = results.put(key, b"data", meta={"ext": "webp"})
+    hit = results.get(key)
+    assert hit.read() == b"data" and hit.meta == {"ext": "webp"} and hit.size == 4
+    assert pickle.loads(pickle.dumps(handle)).read() == b"data"
+    assert results.get(results.key("abc", {"quality": 80})) is None
+
+
+def test_expired_entries_are_removed(tmp_path):
+    results = ResultStore(tmp_path)
+    handle = results.put("a" * 64, b"x", ttl=0.01)
+    time.sleep(0.02)
+    assert results.get("a" * 64) is None
+    assert not handle.exists()
+
+
+def test_lru_evicts_least_recently_used(tmp_path):
+    results = ResultStore(tmp_path, max_bytes=300, min_age=0)
+    handles = [results.put(f"{i:064d}", b"x" * 100) for i in range(3)]
+    for age, handle in zip((30, 10, 20), handles):
+        _age(handle, age)
+    results.put("9" * 64, b"x" * 100)
+    results.evict()
+    # Eldst brukt (30 s) går først
+    assert [h.exists() for h in handles] == [False, True, True]
+
+
+def test_recent_entries_survive_eviction(tmp_path):
+    results = ResultStore(tmp_path, max_bytes=1000 * 1024, min_age=60)
+    handles = [results.put(results.key(str(i), {}), os.urandom(20 * 1024)) for i in range(60)]
+    assert all(h.exists() for h in handles)
+
+
+def test_protection_has_a_hard_limit(tmp_path):
+    results = ResultStore(tmp_path, max_bytes=1000, min_age=60)
+    handles = [results.put(f"{i:064d}", b"x" * 100) for i in range(30)]
+    results.evict()
+    total = sum(h.size for h in handles if h.exists())
+    assert total <= 1000 * store.HARD_LIMIT_FACTOR
+
+
+def test_build_zip_skips_deleted_entries(tmp_path):
+    results = ResultStore(tmp_path)
+    a = results.put("a" * 64, b"aaa")
+    b = results.put("b" * 64, b"bbb")
+    os.unlink(b.path)
+    handle = store.build_zip([("a.webp", a), ("b.webp", b)], results)
+    with zipfile.ZipFile(handle.path) as archive:
+        assert archive.namelist() == ["a.webp"]
+    assert store.build_zip([("a.webp", a), ("b.webp", b)], results).key == handle.key
+
+
+def test_tmp_store_cap_follows_cgroup(monkeypatch):
+    monkeypatch.delenv("MASTER_STORE_DIR", raising=False)
+    monkeypatch.delenv("MASTER_STORE_MAX_MB", raising=False)
+    limit = 4 * 1024 ** 3
+    assert store.default_max_bytes(limit) == int(limit * store.TMP_CGROUP_FRACTION)
+    assert store.memory_bytes(limit) == store.default_max_bytes(limit)
+
+    monkeypatch.setenv("MASTER_STORE_DIR", "/mnt/store")
+    assert store.default_max_bytes(limit) == store.DEFAULT_MAX_MB * 1024 * 1024
+    assert store.memory_bytes(limit) == 0
@@ -0,0 +1,109 @@
+"""Måler kald importtid for hver side og feiler hvis et budsjett overskrides.
+
+Hver side analyseres statisk: importene på toppnivå (utenfor funksjoner og
+``if``-blokker) samles og importeres i en ny Python-prosess, slik at målingen
+tilsvarer en kaldstart. ``streamlit`` importeres først uten å telle med,
+fordi serveren allerede har lastet den før en side kjøres.
+
+Bruk:
+    python tools/import_budget.py                # standardbudsjett
+    python tools/import_budget.py --budget 0.5   # sekunder per side
+    python tools/import_budget.py --json
+
+Avslutter med kode 1 hvis en side bruker mer enn budsjettet, eller hvis en
+av importene (også ``streamlit``) feiler. Moduler som mangler lastes ikke og
+gjør siden kunstig rask, så en slik side regnes som feilet.
+"""
+import argparse
+import ast
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BUDGET = 1.0  # sekunder per side
+
+_PROBE = r"""
+import importlib, json, sys, time
+failed = []
+try:
+    import streamlit  # lastet av serveren før siden kjøres
+except ImportError:
+    failed.append("streamlit")
+start = time.perf_counter()
+for name in sys.argv[1:]:
+    try:
+        importlib.import_module(name)
+    except Exception as e:
+        failed.append(f"{name} ({type(e).__name__})")
+print(json.dumps({"seconds": time.perf_counter() - start, "failed": failed}))
+"""
+
+
+def page_files():
+    """Returnerer hovedsiden og alle sider under ``pages/``."""
+    return sorted(ROOT.glob("*.py")) + sorted((ROOT / "pages").glob("*.py"))
+
+
+def top_level_imports(path):
+    """Finner modulene en side importerer på toppnivå."""
+    tree = ast.parse(path.read_text(encoding="utf-8"), filename=str(path))
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.append(node.module)
+    return [m for m in dict.fromkeys(modules) if m.split(".")[0] != "streamlit"]
+
+
+def measure(modules):
+    """Importerer ``modules`` i en ny prosess og returnerer (sekunder, feilede)."""
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE, *modules],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    return data["seconds"], data["failed"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET,
+                        help=f"Maks importtid per side i sekunder (standard {DEFAULT_BUDGET})")
+    parser.add_argument("--json", action="store_true", help="Skriv resultatet som JSON")
+    args = parser.parse_args(argv)
+
+    report = []
+    for path in page_files():
+        modules = top_level_imports(path)
+        seconds, failed = measure(modules)
+        report.append({
+            "page": path.relative_to(ROOT).as_posix(),
+            "seconds": round(seconds, 4),
+            "modules": modules,
+            "missing": failed,
+            "over_budget": seconds > args.budget,
+            "ok": not failed and seconds <= args.budget,
+        })
+
+    if args.json:
+        print(json.dumps({"budget": args.budget, "pages": report}, ensure_ascii=False, indent=2))
+    else:
+        for entry in report:
+            flag = "FEIL" if entry["missing"] else "OVER" if entry["over_budget"] else "ok"
+            missing = f"  (mangler: {', '.join(entry['missing'])})" if entry["missing"] else ""
+            print(f"{flag:4} {entry['seconds']:7.3f}s  {entry['page']}{missing}")
+
+    over = [e["page"] for e in report if e["over_budget"]]
+    broken = [e["page"] for e in report if e["missing"]]
+    if over:
+        print(f"Importbudsjett på {args.budget}s overskredet: {', '.join(over)}", file=sys.stderr)
+    if broken:
+        print(f"Import feilet, tiden er ikke målt riktig: {', '.join(broken)}", file=sys.stderr)
+    return 1 if over or broken else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())